@@ -1,10 +1,40 @@
 import os
 import json
+import math
+import copy
 import uuid
+import base64
+import glob
+import hashlib
+import time
+import atexit
+import cProfile
+import io
+import pstats
+import queue
+import threading
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file
-import subprocess
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
+from werkzeug.datastructures import MultiDict
+from werkzeug.security import safe_join
+import shutil
 import re
+from compile_cache import CompileCache, SingleFlight, source_hash
+from compile_jobs import CompileJobQueue, QueueFull
+from question_store import VersionConflict, open_question_store, stored_version
+from question_index import SORT_KEYS, QuestionIndex, points_value
+from attempt_log import AttemptJournal
+from attempt_stats import new_question_stats, summarize_question_stats
+from previews import PREVIEW_SIZES, preview_formats, preview_path, render_previews
+from temp_reaper import TempReaper
+from compile_sandbox import LIMIT_CPU, LIMIT_KILLED, LIMIT_OUTPUT, LIMIT_TIMEOUT, resource, run_sandboxed, sandbox_limits
+from metrics import REGISTRY, Collected, Counter, Histogram, time_stage
+from latex_log import LatexOutputParser
+from tex_pool import WarmTexPool
+from figure_cache import FigureCache
+from worksheets import worksheet_document, worksheet_key
+from bank_archive import (METADATA_FILE, PDF_FILE, ArchiveError, archive_formats, export_archive,
+                          open_archive, read_questions)
 
 app = Flask(__name__, static_folder='static')
 
@@ -12,6 +42,34 @@ app = Flask(__name__, static_folder='static')
 os.makedirs('storage', exist_ok=True)
 os.makedirs('storage/temp', exist_ok=True)  # Add temp directory for preview compilations
 
+# Question metadata lives either in per-folder metadata.json files (served
+# from an in-memory index) or in SQLite; compiled files stay in the folders
+QUESTIONS_DIR = os.path.join('storage', 'questions')
+STORAGE_BACKEND = os.environ.get('HEXAGYM_STORAGE', 'folder')
+SQLITE_PATH = os.environ.get('HEXAGYM_SQLITE_PATH', os.path.join('storage', 'questions.db'))
+question_store = open_question_store(STORAGE_BACKEND, QUESTIONS_DIR, SQLITE_PATH)
+
+# Paging for filtered GET /questions; list views leave out the raw LaTeX and answer
+QUESTION_PAGE_SIZE = 50
+QUESTION_PAGE_MAX = 200
+SUMMARY_EXCLUDED_FIELDS = ('content', 'answer')
+SEARCH_PAGE_SIZE = 20
+
+# PDFs requested with their content hash (?v=) can be cached forever
+PDF_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# /pdf serves compiled PDFs only, and only from these folders under storage/
+PDF_SERVE_DIRS = ('questions', 'temp', 'cache/worksheets')
+FILE_DIGEST_CACHE_SIZE = 10000
+_file_digests = {}
+
+# Every answer attempt is appended to a journal under storage/attempts and
+# folded into per-user, per-question progress
+ATTEMPTS_DIR = os.path.join('storage', 'attempts')
+ATTEMPT_FSYNC = os.environ.get('HEXAGYM_ATTEMPT_FSYNC', 'interval')
+LEADERBOARD_PAGE_SIZE = 20
+_attempt_journal = None
+_attempt_journal_lock = threading.Lock()
+
 # LaTeX preamble with common packages
 LATEX_PREAMBLE = r"""\documentclass[12pt]{article}
 \usepackage{tikz}
@@ -35,6 +93,159 @@ LATEX_ENDING = r"""
 \end{document}
 """
 
+# Lines before the question content in question.tex, to map TeX's line numbers back
+PREAMBLE_LINES = LATEX_PREAMBLE.count('\n')
+
+# Precompiled format holding everything in LATEX_PREAMBLE before \begin{document}.
+# Compiles load it with -fmt instead of re-reading tikz, pgfplots, etc. every time.
+USE_PREAMBLE_FORMAT = os.environ.get('HEXAGYM_PREAMBLE_FORMAT', '1') != '0'
+FORMAT_DIR = os.path.join('storage', 'fmt')
+
+# Appended to the dumped preamble so that the \documentclass line of a full
+# question.tex becomes a no-op when compiled against the format. The
+# \usepackage lines are skipped by LaTeX itself since the packages are loaded.
+FORMAT_DUMP_SUFFIX = r"""
+\makeatletter
+\def\documentclass{\@ifnextchar[\hexagym@skipclass{\hexagym@skipclass[]}}
+\def\hexagym@skipclass[#1]#2{}
+\makeatother
+\dump
+"""
+
+# Compile results keyed by the hash of the full document, so rebuilding an
+# unchanged source (a second preview, an edit that only touched hints) is a copy
+COMPILE_CACHE_DIR = os.path.join('storage', 'cache', 'compile')
+COMPILE_CACHE_MAX_BYTES = int(os.environ.get('HEXAGYM_COMPILE_CACHE_MB', '256')) * 1024 * 1024
+compile_cache = CompileCache(COMPILE_CACHE_DIR, COMPILE_CACHE_MAX_BYTES)
+
+# Concurrent compiles of the same document share a single pdflatex run
+compile_flights = SingleFlight()
+
+# Every compile runs on a bounded pool so a burst of previews can't spawn
+# unlimited pdflatex processes; past the queue limit requests get a 429
+COMPILE_WORKERS = int(os.environ.get('HEXAGYM_COMPILE_WORKERS', str(os.cpu_count() or 2)))
+COMPILE_QUEUE_MAX = int(os.environ.get('HEXAGYM_COMPILE_QUEUE_MAX', '32'))
+COMPILE_JOBS_DIR = os.path.join('storage', 'cache', 'jobs')
+compile_jobs = CompileJobQueue(COMPILE_WORKERS, COMPILE_QUEUE_MAX, state_dir=COMPILE_JOBS_DIR)
+
+# Bulk imports keep one compile per worker in flight and save the compiled
+# questions' metadata in batches of up to this many
+BULK_IMPORT_BATCH = int(os.environ.get('HEXAGYM_BULK_BATCH', '25'))
+
+# Fields PUT /questions/<id> may change; an update that changes none writes nothing
+UPDATABLE_FIELDS = ('name', 'tags', 'points', 'hints', 'answer', 'content')
+
+# Preview builds in storage/temp are deleted once older than the max age,
+# and oldest first while the folder is over its size budget
+TEMP_DIR = os.path.join('storage', 'temp')
+TEMP_MAX_AGE = int(os.environ.get('HEXAGYM_TEMP_MAX_AGE', '3600'))
+TEMP_MAX_BYTES = int(os.environ.get('HEXAGYM_TEMP_MAX_MB', '512')) * 1024 * 1024
+# Only the PDF of a preview build is needed afterwards; set to 1 to keep .tex/.log/.aux too
+PREVIEW_KEEP_BUILD_FILES = os.environ.get('HEXAGYM_PREVIEW_KEEP_BUILD_FILES', '0') == '1'
+temp_reaper = TempReaper(TEMP_DIR, TEMP_MAX_AGE, TEMP_MAX_BYTES)
+temp_reaper.start()
+
+# Every TeX run is killed past these limits (wall-clock and CPU seconds,
+# address space and size of any file it writes, in MB; 0 disables one),
+# so a runaway question can't hold a compile worker or fill the disk
+COMPILE_LIMITS = sandbox_limits(
+    int(os.environ.get('HEXAGYM_COMPILE_TIMEOUT', '60')),
+    int(os.environ.get('HEXAGYM_COMPILE_CPU_SECONDS', '30')),
+    int(os.environ.get('HEXAGYM_COMPILE_MEMORY_MB', '1024')),
+    int(os.environ.get('HEXAGYM_COMPILE_OUTPUT_MB', '50'))
+)
+# Compiles taking longer than this many seconds are logged
+SLOW_COMPILE_SECONDS = float(os.environ.get('HEXAGYM_SLOW_COMPILE_SECONDS', '10'))
+
+# tikzpicture and circuitikz figures are compiled once on their own, keyed by
+# their source, and included in every document that uses them as PDFs
+FIGURE_CACHE = os.environ.get('HEXAGYM_FIGURE_CACHE', '1') != '0'
+FIGURE_CACHE_DIR = os.path.join('storage', 'cache', 'figures')
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get('HEXAGYM_FIGURE_CACHE_MB', '128')) * 1024 * 1024
+figure_cache = FigureCache(FIGURE_CACHE_DIR, FIGURE_CACHE_MAX_BYTES, LATEX_PREAMBLE, COMPILE_LIMITS) if FIGURE_CACHE else None
+# What pdflatex compiles when figures were swapped for their PDFs (output is still question.*)
+BUILD_TEX_FILE = 'question.build.tex'
+
+# Worksheets merge the questions' compiled PDFs into one. Built worksheets are
+# kept by title and, in order, each question's id, version and PDF
+WORKSHEET_CACHE_DIR = os.path.join('storage', 'cache', 'worksheets')
+WORKSHEET_CACHE_MAX_BYTES = int(os.environ.get('HEXAGYM_WORKSHEET_CACHE_MB', '256')) * 1024 * 1024
+worksheet_cache = CompileCache(WORKSHEET_CACHE_DIR, WORKSHEET_CACHE_MAX_BYTES)
+
+# Error codes of compiles stopped by a limit; they answer with a 422
+LIMIT_ERRORS = {
+    LIMIT_TIMEOUT: ('compile_timeout', "Compilation took longer than {wall_seconds}s and was stopped"),
+    LIMIT_CPU: ('compile_cpu_limit', "Compilation used more than {cpu_seconds}s of CPU time and was stopped"),
+    LIMIT_OUTPUT: ('compile_output_limit', "Compilation output grew past the size limit and was stopped"),
+    LIMIT_KILLED: ('compile_killed', "Compilation was killed before it finished")
+}
+
+# Served in Prometheus' text format at /metrics. Every server process keeps
+# its own, so in production mode each scrape sees one worker's numbers.
+REQUEST_SECONDS = Histogram('hexagym_request_seconds', "Time to handle a request, by route.",
+                            labels=('method', 'route', 'status'))
+RESPONSE_BYTES = Counter('hexagym_response_bytes_total', "Bytes of response bodies sent, by route.",
+                         labels=('route',))
+COMPILE_SECONDS = Histogram('hexagym_compile_seconds', "Time for compile_latex_for_question, cache hits included.")
+COMPILES = Counter('hexagym_compiles_total', "Compiles by where the result came from and how it ended.",
+                   labels=('source', 'outcome'))
+COMPILE_CPU_SECONDS = Counter('hexagym_compile_cpu_seconds_total', "CPU seconds used by pdflatex runs.")
+Collected('hexagym_compile_jobs', "Compile jobs queued and running.", 'gauge',
+          lambda: {(state,): compile_jobs.stats()[state] for state in ('queued', 'running')}, labels=('state',))
+Collected('hexagym_compile_cache_requests_total', "Compile cache lookups by result.", 'counter',
+          lambda: {('hit',): compile_cache.stats()['hits'], ('miss',): compile_cache.stats()['misses']},
+          labels=('result',))
+Collected('hexagym_compile_cache_bytes', "Size of the compile cache.", 'gauge',
+          lambda: compile_cache.stats()['bytes'])
+Collected('hexagym_figure_cache_requests_total', "Figure cache lookups by result.", 'counter',
+          lambda: {('hit',): figure_cache.stats()['hits'], ('miss',): figure_cache.stats()['misses']} if figure_cache else {},
+          labels=('result',))
+Collected('hexagym_figure_cache_bytes', "Size of the figure cache.", 'gauge',
+          lambda: figure_cache.stats()['bytes'] if figure_cache else 0)
+Collected('hexagym_warm_pool_requests_total', "First passes that found a warm TeX worker, or didn't.", 'counter',
+          lambda: {('hit',): warm_pool.stats()['hits'], ('miss',): warm_pool.stats()['misses']} if warm_pool else {},
+          labels=('result',))
+Collected('hexagym_temp_bytes', "Size of storage/temp at the last cleanup.", 'gauge',
+          lambda: temp_reaper.stats()['bytes'])
+Collected('hexagym_temp_bytes_reclaimed_total', "Bytes of storage/temp folders the cleanup removed.", 'counter',
+          lambda: temp_reaper.stats()['bytes_reclaimed'])
+Collected('hexagym_temp_folders_removed_total', "storage/temp folders the cleanup removed.", 'counter',
+          lambda: temp_reaper.stats()['removed'])
+
+# With HEXAGYM_PROFILING=1, any request with ?profile=1 answers with a
+# cProfile summary of its own handling instead of its normal response
+PROFILING = os.environ.get('HEXAGYM_PROFILING', '0') == '1'
+PROFILE_LINES = 40
+# The interpreter allows one active profiler at a time
+_profile_lock = threading.Lock()
+
+# With HEXAGYM_COMPILE_ENGINE=warm, the first pdflatex pass of a compile runs
+# on one of HEXAGYM_WARM_WORKERS TeX processes that already loaded the
+# preamble and wait for the question body. Compiles that find no waiting
+# worker, and every later pass, run the usual subprocess way.
+COMPILE_ENGINE = os.environ.get('HEXAGYM_COMPILE_ENGINE', 'subprocess')
+WARM_WORKERS = int(os.environ.get('HEXAGYM_WARM_WORKERS', str(COMPILE_WORKERS)))
+WARM_POOL_DIR = os.path.join('storage', 'cache', 'warm')
+warm_pool = None
+if COMPILE_ENGINE == 'warm':
+    if resource is None or not hasattr(os, 'mkfifo'):
+        print("The warm compile engine needs a Unix system, using subprocess compiles")
+    else:
+        warm_pool = WarmTexPool(WARM_WORKERS, WARM_POOL_DIR, LATEX_PREAMBLE, LATEX_ENDING, COMPILE_LIMITS)
+        atexit.register(warm_pool.close)
+
+# A streamed compile sends a comment line when it has been quiet this long
+SSE_KEEPALIVE_SECONDS = 15
+
+# pdflatex is only run again when the log says the output is not settled yet
+MAX_LATEX_PASSES = 3
+RERUN_PATTERN = re.compile(
+    r'Rerun to get|Rerun LaTeX|Label\(s\) may have changed|Please \(?re\)?run'
+)
+
+_format_lock = threading.Lock()
+_format_state = {'name': None, 'path': None, 'failed': False}
+
 def sanitize_filename(name):
     """Convert a string to a safe filename."""
     # Replace spaces and special characters
@@ -46,12 +257,248 @@ def create_question_folder(name):
     unique_id = str(uuid.uuid4())[:8]
     safe_name = sanitize_filename(name)
     folder_name = f"{safe_name}_{unique_id}"
-    folder_path = os.path.join('storage', 'questions', folder_name)
+    folder_path = os.path.join(QUESTIONS_DIR, folder_name)
     os.makedirs(folder_path, exist_ok=True)
     return folder_path, unique_id
 
-def compile_latex_for_question(latex_code, folder_path):
-    """Compile LaTeX code and save files in the question folder."""
+def get_attempt_journal():
+    """Open the attempt journal on first use (not in the reloader's parent process)."""
+    global _attempt_journal
+    with _attempt_journal_lock:
+        if _attempt_journal is None:
+            _attempt_journal = AttemptJournal(ATTEMPTS_DIR, fsync=ATTEMPT_FSYNC)
+            atexit.register(_attempt_journal.close)
+        return _attempt_journal
+
+def parse_time_spent(value):
+    """Seconds from a number or the attempt timer's MM:SS / HH:MM:SS text.
+
+    Text that isn't a time counts as 0; a negative or non-finite time
+    raises ValueError.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        parts = [value]
+    else:
+        try:
+            parts = [float(part) for part in str(value).split(':')]
+        except ValueError:
+            return 0
+    if not all(math.isfinite(part) and part >= 0 for part in parts):
+        raise ValueError("timeSpent must be a finite, non-negative time")
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return int(seconds) if seconds == int(seconds) else seconds
+
+def preamble_format_name():
+    """Name of the format file for the current LATEX_PREAMBLE."""
+    digest = hashlib.sha256(LATEX_PREAMBLE.encode('utf-8')).hexdigest()[:12]
+    return f"preamble_{digest}"
+
+def ensure_preamble_format():
+    """Build the preamble format if missing or stale and return its path.
+
+    Returns None when formats are disabled or the build failed, in which case
+    callers compile the plain way.
+    """
+    if not USE_PREAMBLE_FORMAT:
+        return None
+
+    name = preamble_format_name()
+    fmt_dir = os.path.abspath(FORMAT_DIR)
+    fmt_path = os.path.join(fmt_dir, name)
+
+    with _format_lock:
+        if _format_state['name'] == name:
+            return None if _format_state['failed'] else fmt_path
+
+        _format_state.update({'name': name, 'path': fmt_path, 'failed': False})
+        if os.path.exists(fmt_path + '.fmt'):
+            return fmt_path
+
+        # Build in a private folder and move the result into place, so server
+        # processes starting together never load a half-written format
+        build_dir = os.path.join(fmt_dir, f"build-{os.getpid()}")
+        try:
+            os.makedirs(fmt_dir, exist_ok=True)
+
+            # Formats built from an older preamble are never used again
+            for old in glob.glob(os.path.join(fmt_dir, 'preamble_*')):
+                if not os.path.basename(old).startswith(name):
+                    os.unlink(old)
+
+            os.makedirs(build_dir, exist_ok=True)
+            header = LATEX_PREAMBLE[:LATEX_PREAMBLE.find(r'\begin{document}')]
+            dump_path = os.path.join(build_dir, name + '.tex')
+            with open(dump_path, 'w', encoding='utf-8') as f:
+                f.write(header + FORMAT_DUMP_SUFFIX)
+
+            process = run_sandboxed(
+                ['pdflatex', '-ini', '-interaction=nonstopmode', f'-jobname={name}',
+                 '-output-directory', build_dir, '&pdflatex', dump_path],
+                COMPILE_LIMITS
+            )
+            built_path = os.path.join(build_dir, name + '.fmt')
+            if process.returncode != 0 or not os.path.exists(built_path):
+                print(f"Building preamble format failed, using plain compiles: {process.stdout[-500:]}")
+                _format_state['failed'] = True
+                return None
+            os.replace(built_path, fmt_path + '.fmt')
+        except Exception as e:
+            print(f"Building preamble format failed, using plain compiles: {e}")
+            _format_state['failed'] = True
+            return None
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+        return fmt_path
+
+def invalidate_preamble_format():
+    """Drop the current format, e.g. after TeX reported it as unusable."""
+    with _format_lock:
+        path = _format_state['path']
+        _format_state.update({'name': None, 'path': None, 'failed': False})
+        if path and os.path.exists(path + '.fmt'):
+            os.unlink(path + '.fmt')
+
+def run_pdflatex(tex_path, folder_path, fmt_path=None, on_line=None, source_path=None):
+    """Run a single sandboxed pdflatex pass, optionally against a precompiled format.
+
+    The output is named after tex_path; source_path, if given, is the file
+    actually compiled.
+    """
+    job_name = os.path.splitext(os.path.basename(tex_path))[0]
+    command = ['pdflatex', '-interaction=nonstopmode', f'-jobname={job_name}', '-output-directory', folder_path]
+    if fmt_path:
+        command.insert(1, f'-fmt={fmt_path}')
+    command.append(source_path or tex_path)
+    return run_sandboxed(command, COMPILE_LIMITS, on_line=on_line)
+
+def is_format_error(process):
+    """Whether pdflatex refused to load the format (e.g. after a TeX upgrade)."""
+    output = process.stdout or ''
+    return 'Fatal format file error' in output or "I can't find the format file" in output
+
+def needs_rerun(log_path):
+    """Whether the log of the last pass asks for another one."""
+    if not os.path.exists(log_path):
+        return False
+    with time_stage('rerun_check'), open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+        return RERUN_PATTERN.search(f.read()) is not None
+
+def add_usage(total, usage):
+    """Fold one run's resource usage into the total for a compile."""
+    for key in ('cpu_seconds', 'wall_seconds'):
+        if usage[key] is not None:
+            total[key] = round((total[key] or 0) + usage[key], 3)
+    if usage['max_rss_kb'] is not None:
+        total['max_rss_kb'] = max(total['max_rss_kb'] or 0, usage['max_rss_kb'])
+
+def run_latex_passes(tex_path, folder_path, log_path, on_event=None, latex_code=None, source_path=None):
+    """Run pdflatex until the output settles.
+
+    Returns (success, error, passes, error_code, usage): error_code is set
+    when a pass was stopped by COMPILE_LIMITS, and usage adds up the CPU and
+    wall-clock seconds of all passes along with the peak RSS of any of them.
+
+    pdflatex's output is parsed as it is written; on_event, if given, is
+    called with ('pass', ...) as each pass starts and with the 'page' and
+    'error' events of LatexOutputParser as they happen.
+
+    Given the question's latex_code, the first pass runs on the warm pool
+    when there is one (and a worker is free). source_path is passed on to
+    run_pdflatex.
+    """
+    usage = {'cpu_seconds': None, 'max_rss_kb': None, 'wall_seconds': None}
+
+    def run_pass(number, fmt_path, body=None):
+        parser = LatexOutputParser()
+        # A warm worker reads the body from its own file, so TeX numbers its lines from there
+        line_offset = PREAMBLE_LINES if body is not None else 0
+
+        def emit(events):
+            if on_event is None:
+                return
+            for name, payload in events:
+                if name == 'error' and payload['line']:
+                    # Also say where the error is in the author's own content
+                    line = payload['line'] + line_offset
+                    content_line = line - PREAMBLE_LINES
+                    payload = {**payload, 'line': line, 'content_line': content_line if content_line > 0 else None}
+                on_event(name, {'pass': number, **payload})
+
+        emit([('pass', {})])
+        process = None
+        if body is not None:
+            with time_stage(f'warm_pass_{number}'):
+                process = warm_pool.run(body, fmt_path, tex_path, lambda line: emit(parser.feed(line)))
+        if process is None:
+            line_offset = 0
+            with time_stage(f'pdflatex_pass_{number}'):
+                process = run_pdflatex(tex_path, folder_path, fmt_path, lambda line: emit(parser.feed(line)),
+                                       source_path)
+        emit(parser.close())
+        add_usage(usage, process.usage)
+        return process, parser
+
+    # Compile LaTeX to PDF, against the precompiled preamble when available
+    with time_stage('preamble_format'):
+        fmt_path = ensure_preamble_format()
+    process, parser = run_pass(1, fmt_path, latex_code if warm_pool is not None else None)
+    if fmt_path and is_format_error(process):
+        # Stale or incompatible format: rebuild next time, compile plain now
+        invalidate_preamble_format()
+        fmt_path = None
+        process, parser = run_pass(1, None)
+    passes = 1
+
+    # Run again only while the log asks for it (cross-references etc.)
+    while process.returncode == 0 and passes < MAX_LATEX_PASSES and needs_rerun(log_path):
+        passes += 1
+        process, parser = run_pass(passes, fmt_path)
+
+    if process.limit_error:
+        error_code, message = LIMIT_ERRORS[process.limit_error]
+        return False, message.format(**COMPILE_LIMITS), passes, error_code, usage
+
+    success = process.returncode == 0
+    error_message = None if success else parser.error_message()
+
+    # Errors that never reached the terminal output are still in the log
+    if not success and error_message is None and os.path.exists(log_path):
+        with time_stage('log_scan'), open(log_path, 'r', encoding='utf-8') as f:
+            log_content = f.read()
+            if '!' in log_content:
+                error_message = log_content[log_content.find('!'):]
+                error_message = error_message[:error_message.find('\n\n')]
+
+    return success, error_message, passes, None, usage
+
+def compile_latex_for_question(latex_code, folder_path, on_event=None):
+    """Compile LaTeX code and save files in the question folder.
+
+    on_event receives progress as pdflatex runs (see run_latex_passes);
+    cached and coalesced compiles finish without any.
+    """
+    with COMPILE_SECONDS.time():
+        result = _compile_latex_for_question(latex_code, folder_path, on_event)
+
+    if result.get('cached'):
+        source = 'cache'
+    elif result.get('coalesced'):
+        source = 'coalesced'
+    else:
+        source = 'pdflatex'
+    if result['success']:
+        outcome = 'success'
+    else:
+        outcome = result.get('error_code') or 'failure'
+    COMPILES.inc(source=source, outcome=outcome)
+    if result.get('usage') and result['usage']['cpu_seconds']:
+        COMPILE_CPU_SECONDS.inc(result['usage']['cpu_seconds'])
+    return result
+
+def _compile_latex_for_question(latex_code, folder_path, on_event):
     try:
         # Define file paths
         tex_path = os.path.join(folder_path, 'question.tex')
@@ -60,67 +507,286 @@ def compile_latex_for_question(latex_code, folder_path):
 
         # Write LaTeX code to file
         full_latex_code = LATEX_PREAMBLE + latex_code + LATEX_ENDING
-        with open(tex_path, 'w', encoding='utf-8') as f:
+        with time_stage('write_tex'), open(tex_path, 'w', encoding='utf-8') as f:
             f.write(full_latex_code)
 
-        # Compile LaTeX to PDF
-        process = subprocess.run(
-            ['pdflatex', '-interaction=nonstopmode', '-output-directory', folder_path, tex_path],
-            capture_output=True,
-            text=True
-        )
-        
-        # Run second time to resolve references if first run was successful
-        if process.returncode == 0:
-            process = subprocess.run(
-                ['pdflatex', '-interaction=nonstopmode', '-output-directory', folder_path, tex_path],
-                capture_output=True,
-                text=True
-            )
+        # Reuse an earlier build of the exact same document if we have one
+        cache_key = source_hash(full_latex_code)
+        with time_stage('cache_lookup'):
+            cached = compile_cache.get(cache_key)
+        if cached:
+            try:
+                if 'pdf_path' in cached:
+                    with time_stage('cache_copy'):
+                        shutil.copyfile(cached['pdf_path'], pdf_path)
+                return {
+                    'success': 'pdf_path' in cached,
+                    'error': cached.get('error'),
+                    'tex_path': tex_path,
+                    'pdf_path': pdf_path if 'pdf_path' in cached else None,
+                    'passes': 0,
+                    'cached': True
+                }
+            except OSError:
+                # Evicted between lookup and copy, just compile it
+                pass
 
-        success = process.returncode == 0
-        error_message = None
+        # Someone may already be compiling this exact document, wait for them
+        is_leader, flight = compile_flights.begin(cache_key)
+        if not is_leader:
+            with time_stage('coalesced_wait'):
+                shared = compile_flights.wait(flight)
+            # The leader may have compiled into this very folder
+            if shared['success'] and os.path.realpath(shared['pdf_path']) != os.path.realpath(pdf_path):
+                shutil.copyfile(shared['pdf_path'], pdf_path)
+            return {
+                'success': shared['success'],
+                'error': shared['error'],
+                'error_code': shared.get('error_code'),
+                'tex_path': tex_path,
+                'pdf_path': pdf_path if shared['success'] else None,
+                'passes': 0,
+                'cached': False,
+                'coalesced': True
+            }
 
-        if not success and os.path.exists(log_path):
-            with open(log_path, 'r', encoding='utf-8') as f:
-                log_content = f.read()
-                if '!' in log_content:
-                    error_message = log_content[log_content.find('!'):]
-                    error_message = error_message[:error_message.find('\n\n')]
+        shared = {'success': False, 'error': 'Compilation failed', 'pdf_path': None}
+        try:
+            # Figures come from the figure cache; the document includes their PDFs.
+            # That version goes to its own build file, question.tex keeps the source.
+            body = latex_code
+            build_path = os.path.join(folder_path, BUILD_TEX_FILE)
+            figure_runs = []
+            if figure_cache is not None:
+                with time_stage('figure_externalize'):
+                    body = figure_cache.externalize(latex_code, folder_path, figure_runs.append)
+
+            # Figures compile under the same limits and count toward the same usage
+            stopped = next((run.limit_error for run in figure_runs if run.limit_error), None)
+            if stopped:
+                error_code, message = LIMIT_ERRORS[stopped]
+                success, error_message, passes = False, message.format(**COMPILE_LIMITS), 0
+                usage = {'cpu_seconds': None, 'max_rss_kb': None, 'wall_seconds': None}
+            else:
+                if body != latex_code:
+                    with time_stage('write_tex'), open(build_path, 'w', encoding='utf-8') as f:
+                        f.write(LATEX_PREAMBLE + body + LATEX_ENDING)
+                elif os.path.exists(build_path):
+                    os.unlink(build_path)
+
+                success, error_message, passes, error_code, usage = run_latex_passes(
+                    tex_path, folder_path, log_path, on_event, body, build_path if body != latex_code else None)
+            for run in figure_runs:
+                add_usage(usage, run.usage)
+
+            with time_stage('cache_store'):
+                if success:
+                    compile_cache.put_pdf(cache_key, pdf_path)
+                elif error_code is None:
+                    # A run stopped by a limit may well succeed on a less busy machine
+                    compile_cache.put_error(cache_key, error_message)
+
+            if usage['wall_seconds'] and usage['wall_seconds'] > SLOW_COMPILE_SECONDS:
+                print(f"Slow compile of {tex_path}: {usage['wall_seconds']}s wall, "
+                      f"{usage['cpu_seconds']}s CPU, {usage['max_rss_kb']} KB peak RSS, {passes} passes")
+
+            shared = {'success': success, 'error': error_message, 'error_code': error_code,
+                      'pdf_path': pdf_path if success else None}
+        except Exception as e:
+            shared['error'] = str(e)
+            raise
+        finally:
+            compile_flights.finish(cache_key, shared)
 
         return {
             'success': success,
             'error': error_message,
+            'error_code': error_code,
             'tex_path': tex_path,
-            'pdf_path': pdf_path if success else None
+            'pdf_path': pdf_path if success else None,
+            'passes': passes,
+            'usage': usage,
+            'cached': False
         }
     except Exception as e:
         return {
             'success': False,
             'error': str(e),
             'tex_path': None,
-            'pdf_path': None
+            'pdf_path': None,
+            'passes': 0
         }
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if PROFILING and request.args.get('profile') == '1' and _profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_request_metrics(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+        response = profile_response(profiler, response)
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if 'request_started' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started,
+                                method=request.method, route=route, status=str(response.status_code))
+    # Streamed responses (bulk import) have no length up front and aren't counted
+    if response.content_length:
+        RESPONSE_BYTES.inc(response.content_length, route=route)
+    return response
+
+@app.teardown_request
+def stop_profiler(exc):
+    # after_request is skipped when a view raises; never leave the profiler running
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+
+def profile_response(profiler, response):
+    """Replace a response with the profile of the request that produced it.
+
+    Compiles run on the compile pool, so for them the profile shows the wait
+    rather than pdflatex; hexagym_stage_seconds breaks those down instead.
+    """
+    out = io.StringIO()
+    out.write(f"{request.method} {request.full_path} -> {response.status}\n\n")
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    return Response(out.getvalue(), mimetype='text/plain')
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     return app.send_static_file('index.html')
 
 @app.route('/questions', methods=['GET'])
 def get_questions():
-    questions_dir = os.path.join('storage', 'questions')
-    if not os.path.exists(questions_dir):
-        return jsonify([])
-    
-    questions = []
-    for folder in os.listdir(questions_dir):
-        json_path = os.path.join(questions_dir, folder, 'metadata.json')
-        if os.path.exists(json_path):
-            with open(json_path, 'r') as f:
-                question = json.load(f)
-                questions.append(question)
-    
-    return jsonify(questions)
+    # Plain GET /questions keeps returning the full list
+    if not request.args:
+        return conditional_json(question_store.all())
+
+    try:
+        query = parse_question_query(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    questions, total, next_after = question_store.query(**query['filters'])
+    return conditional_json({
+        "questions": [project_question(q, query['view'], query['fields']) for q in questions],
+        "total": total,
+        "next_cursor": encode_cursor(next_after) if next_after is not None else None
+    })
+
+@app.route('/questions/search', methods=['GET'])
+def search_questions():
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({"success": False, "error": "No search query provided"}), 400
+
+    try:
+        limit = min(int(request.args.get('limit', SEARCH_PAGE_SIZE)), QUESTION_PAGE_MAX)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"success": False, "error": "limit and offset must be numbers"}), 400
+
+    results, total = question_store.search(text, limit, offset)
+    return conditional_json({
+        "results": [
+            {**project_question(question, 'summary', None), "score": round(score, 4)}
+            for question, score in results
+        ],
+        "total": total,
+        "next_offset": offset + limit if offset + limit < total else None
+    })
+
+def parse_question_query(args):
+    """Turn GET /questions query parameters into store.query() arguments.
+
+    tag=<type>:<value> (repeatable; any value of a type, every type given),
+    min_points, max_points, sort=[-]created_at|name|points|compile_time, limit, cursor,
+    view=summary (no content/answer) and fields=<comma separated keys>.
+    """
+    tags = {}
+    for tag in args.getlist('tag'):
+        tag_type, sep, value = tag.partition(':')
+        if not sep:
+            raise ValueError(f"Tag filter must look like type:value, got {tag!r}")
+        tags.setdefault(tag_type, []).append(value.lower())
+
+    sort = args.get('sort', 'created_at')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Cannot sort by {sort!r}")
+
+    try:
+        min_points = float(args['min_points']) if 'min_points' in args else None
+        max_points = float(args['max_points']) if 'max_points' in args else None
+        limit = min(int(args.get('limit', QUESTION_PAGE_SIZE)), QUESTION_PAGE_MAX)
+    except ValueError:
+        raise ValueError("min_points, max_points and limit must be numbers")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    view = args.get('view', 'full')
+    if view not in ('full', 'summary'):
+        raise ValueError(f"Unknown view {view!r}")
+    fields = [f for f in args.get('fields', '').split(',') if f] or None
+
+    return {
+        'filters': {
+            'tags': tags,
+            'min_points': min_points,
+            'max_points': max_points,
+            'sort': sort,
+            'descending': descending,
+            'after': decode_cursor(args['cursor'], sort) if args.get('cursor') else None,
+            'limit': limit
+        },
+        'view': view,
+        'fields': fields
+    }
+
+def encode_cursor(after):
+    """Opaque page cursor for the (sort value, id) of the last question returned."""
+    return base64.urlsafe_b64encode(json.dumps(list(after)).encode('utf-8')).decode('ascii')
+
+# Sort keys whose values are numbers; the others sort by string
+NUMERIC_SORT_KEYS = ('points', 'compile_time')
+
+def decode_cursor(cursor, sort):
+    """The (sort value, id) a cursor encodes, checked against the sort it is used with."""
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(after, list) or len(after) != 2 or not isinstance(after[1], str):
+        raise ValueError("Invalid cursor")
+    sort_value, question_id = after
+    if sort in NUMERIC_SORT_KEYS:
+        if isinstance(sort_value, bool) or not isinstance(sort_value, (int, float)):
+            raise ValueError(f"Cursor does not belong to sort={sort}")
+        return float(sort_value), question_id
+    if not isinstance(sort_value, str):
+        raise ValueError(f"Cursor does not belong to sort={sort}")
+    return sort_value, question_id
+
+def project_question(question, view, fields):
+    """Drop the heavy fields list views don't need."""
+    if fields:
+        return {key: question[key] for key in ['id'] + fields if key in question}
+    if view == 'summary':
+        return {key: value for key, value in question.items() if key not in SUMMARY_EXCLUDED_FIELDS}
+    return question
 
 @app.route('/questions', methods=['POST'])
 def add_question():
@@ -130,123 +796,594 @@ def add_question():
         if not name:
             return jsonify({"success": False, "error": "Question name is required"}), 400
 
-        # Create question folder
-        folder_path, unique_id = create_question_folder(name)
+        return run_compile_job(create_question, data)
 
-        # Compile LaTeX
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def compile_failure(compilation_result):
+    """Response payload and status for a failed compile.
+
+    Compiles stopped by a resource limit are the question's fault rather
+    than the server's, so they get a 422 and an error_code saying which limit.
+    """
+    payload = {"success": False, "error": f"LaTeX compilation failed: {compilation_result['error']}"}
+    if compilation_result.get('error_code'):
+        payload["error_code"] = compilation_result['error_code']
+        return payload, 422
+    return payload, 500
+
+def compile_record(compilation_result):
+    """Resource usage of a compile, kept in the question's metadata."""
+    if not compilation_result.get('usage'):
+        return None
+    return {**compilation_result['usage'], "passes": compilation_result['passes']}
+
+def create_question(data):
+    """Compile a new question and save its metadata. Runs on the compile pool."""
+    folder_path, metadata, failure = build_question(data)
+    if failure:
+        return failure
+
+    # Save metadata
+    question_store.save(folder_path, metadata)
+
+    return {"success": True, "id": metadata['id'], "metadata": metadata}, 200
+
+def discard_question_folder(folder_path, question_id):
+    """Remove the folder of a question that failed to build, and any index entry a scan gave it."""
+    shutil.rmtree(folder_path, ignore_errors=True)
+    question_store.remove(question_id)
+
+def build_question(data):
+    """Compile a new question without saving it.
+
+    Returns (folder_path, metadata, failure), failure being the
+    (payload, status) of a failed compile or None; a failed question's
+    folder is removed.
+    """
+    name = data['name']
+
+    # Create question folder
+    folder_path, unique_id = create_question_folder(name)
+
+    # Compile LaTeX; a question that doesn't build leaves nothing behind
+    try:
         compilation_result = compile_latex_for_question(data.get('content', ''), folder_path)
-        if not compilation_result['success']:
-            return jsonify({
-                "success": False,
-                "error": f"LaTeX compilation failed: {compilation_result['error']}"
-            }), 500
-
-        # Create metadata
-        metadata = {
-            "id": unique_id,
-            "name": name,
-            "created_at": datetime.now().isoformat(),
-            "tags": data.get('tags', []),
-            "points": data.get('points', 0),
-            "hints": [
-                {
-                    "text": hint.get('text', ''),
-                    "points_deduction": hint.get('points_deduction', 0)
-                }
-                for hint in data.get('hints', [])
-            ],
-            "answer": data.get('answer', ''),
-            "content": data.get('content', ''),  # Store raw LaTeX content
-            "files": {
-                "tex": os.path.relpath(compilation_result['tex_path'], 'storage'),
-                "pdf": os.path.relpath(compilation_result['pdf_path'], 'storage')
+        if compilation_result['success']:
+            # Thumbnail and page renders for the question list
+            pdf_hash = file_digest(compilation_result['pdf_path'])
+            render_previews(compilation_result['pdf_path'], folder_path, pdf_hash)
+    except Exception:
+        discard_question_folder(folder_path, unique_id)
+        raise
+    if not compilation_result['success']:
+        discard_question_folder(folder_path, unique_id)
+        return None, None, compile_failure(compilation_result)
+
+    # Create metadata
+    metadata = {
+        "id": unique_id,
+        "name": name,
+        "created_at": datetime.now().isoformat(),
+        "tags": data.get('tags', []),
+        "points": data.get('points', 0),
+        "hints": [
+            {
+                "text": hint.get('text', ''),
+                "points_deduction": hint.get('points_deduction', 0)
             }
+            for hint in data.get('hints', [])
+        ],
+        "answer": data.get('answer', ''),
+        "content": data.get('content', ''),  # Store raw LaTeX content
+        "version": 1,
+        "files": {
+            "tex": os.path.relpath(compilation_result['tex_path'], 'storage'),
+            "pdf": os.path.relpath(compilation_result['pdf_path'], 'storage'),
+            "pdf_hash": pdf_hash
         }
+    }
+    if compile_record(compilation_result):
+        metadata["compile"] = compile_record(compilation_result)
+    return folder_path, metadata, None
 
-        # Save metadata
-        metadata_path = os.path.join(folder_path, 'metadata.json')
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+@app.route('/questions/bulk', methods=['POST'])
+def bulk_import_questions():
+    """Import many questions in one request.
 
-        return jsonify({"success": True, "id": unique_id, "metadata": metadata})
+    The body is a JSON array of questions, or JSON Lines (one question per
+    line) when sent as application/x-ndjson. Questions compile in parallel
+    on the compile pool; the response streams one JSON line per question
+    as it finishes ({"index", "success", "id" or "error"}), then a summary
+    line.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        items = read_json_lines(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({"success": False, "error": "Expected a JSON array of questions"}), 400
+        items = enumerate(data)
 
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    results = stream_with_context(json_lines(bulk_import(items)))
+    return Response(results, mimetype='application/x-ndjson')
 
-@app.route('/questions/<question_id>', methods=['PUT'])
-def update_question(question_id):
+def read_json_lines(stream):
+    """Yield (index, question) per non-blank line; unparseable lines yield an error string."""
+    index = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError as e:
+            yield index, f"Invalid JSON: {e}"
+        index += 1
+
+def json_lines(results):
+    for result in results:
+        yield json.dumps(result) + '\n'
+
+def bulk_import(items):
+    """Compile and save (index, question) items, yielding a result for each."""
+    finished = queue.Queue()
+    batch = []
+    imported = failed = in_flight = 0
+
+    def compile_item(index, data):
+        try:
+            folder_path, metadata, failure = build_question(data)
+        except Exception as e:
+            folder_path, metadata, failure = None, None, ({"success": False, "error": str(e)}, 500)
+        finished.put((index, folder_path, metadata, failure))
+        return {"success": failure is None}, 200
+
+    def save_batch():
+        question_store.save_many([(folder_path, metadata) for _, folder_path, metadata in batch])
+        results = [{"index": index, "success": True, "id": metadata['id'], "name": metadata['name']}
+                   for index, _, metadata in batch]
+        batch.clear()
+        return results
+
+    items = iter(items)
+    waiting = None  # item the compile queue had no room for
+    exhausted = False
+    while not exhausted or in_flight:
+        # Keep one compile per worker in flight
+        while not exhausted and in_flight < compile_jobs.workers:
+            if waiting is None:
+                try:
+                    waiting = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+            index, data = waiting
+            error = None
+            if not isinstance(data, dict):
+                error = data if isinstance(data, str) else "Question must be a JSON object"
+            elif not data.get('name'):
+                error = "Question name is required"
+            if error:
+                failed += 1
+                waiting = None
+                yield {"index": index, "success": False, "error": error}
+                continue
+            try:
+                compile_jobs.submit(compile_item, index, data)
+            except QueueFull:
+                # Other requests are using the pool; retry once one of ours is done
+                if not in_flight:
+                    time.sleep(0.1)
+                    continue
+                break
+            waiting = None
+            in_flight += 1
+
+        if not in_flight:
+            continue
+
+        index, folder_path, metadata, failure = finished.get()
+        in_flight -= 1
+        if failure:
+            failed += 1
+            yield {"index": index, **failure[0]}
+        else:
+            batch.append((index, folder_path, metadata))
+
+        # Group commit: save whatever finished together, up to the batch size
+        if len(batch) >= BULK_IMPORT_BATCH or (batch and finished.empty()):
+            results = save_batch()
+            imported += len(results)
+            yield from results
+
+    yield {"done": True, "imported": imported, "failed": failed}
+
+@app.route('/worksheets', methods=['POST'])
+def create_worksheet():
+    """Merge the compiled PDFs of many questions into one worksheet PDF.
+
+    The body picks the questions either by id, {"ids": [...]} in worksheet
+    order, or with the filters of GET /questions ({"tag": ["topic:Physics"],
+    "sort": "points", "limit": 30, ...}), and may give a "title". The
+    response streams a JSON line per question once its PDF is ready
+    ({"index", "id", "source": "pdf" or "compiled"}), then a "done" line
+    with the worksheet's pdf_url. A worksheet built before comes back as
+    the "done" line alone.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"success": False, "error": "Expected a JSON object"}), 400
+    title = data.get('title')
+    if title is not None and not isinstance(title, str):
+        return jsonify({"success": False, "error": "title must be a string"}), 400
+
+    if 'ids' in data:
+        ids = data['ids']
+        if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+            return jsonify({"success": False, "error": "ids must be a list of question ids"}), 400
+        if len(ids) > QUESTION_PAGE_MAX:
+            return jsonify({"success": False, "error": f"A worksheet has at most {QUESTION_PAGE_MAX} questions"}), 400
+        entries = [question_store.get(question_id) for question_id in ids]
+        missing = [question_id for question_id, entry in zip(ids, entries) if entry is None]
+        if missing:
+            return jsonify({"success": False, "error": "Question not found", "missing": missing}), 404
+    else:
+        args = MultiDict()
+        for key in ('tag', 'min_points', 'max_points', 'sort', 'limit'):
+            values = data.get(key)
+            for value in values if isinstance(values, list) else [values]:
+                if value is not None:
+                    args.add(key, str(value))
+        try:
+            query = parse_question_query(args)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+        questions, _, _ = question_store.query(**query['filters'])
+        entries = [entry for entry in (question_store.get(q['id']) for q in questions) if entry]
+    if not entries:
+        return jsonify({"success": False, "error": "No questions selected"}), 400
+
+    cache_key = worksheet_key([entry['metadata'] for entry in entries], title)
+    cached = worksheet_cache.get(cache_key)
+    if cached and 'pdf_path' in cached:
+        done = {"done": True, **worksheet_result(cached['pdf_path'], len(entries), cached=True)}
+        return Response(json_lines([done]), mimetype='application/x-ndjson')
+
+    events = queue.Queue()
     try:
-        data = request.json
-        questions_dir = os.path.join('storage', 'questions')
-        
-        # Find question folder
-        question_folder = None
-        for folder in os.listdir(questions_dir):
-            if folder.endswith(question_id):
-                question_folder = folder
+        job_id = compile_jobs.submit(build_worksheet, entries, title, cache_key, events)
+    except QueueFull:
+        return jsonify({
+            "success": False,
+            "error": "Too many compilations in progress, please try again shortly"
+        }), 429, {'Retry-After': '2'}
+
+    def stream():
+        while True:
+            try:
+                event = events.get(timeout=SSE_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                # Blank line, keeps proxies from closing a quiet connection
+                yield '\n'
+                continue
+            if event is None:
                 break
-        
-        if not question_folder:
-            return jsonify({"success": False, "error": "Question not found"}), 404
+            yield json.dumps(event) + '\n'
+        job = compile_jobs.wait(job_id)
+        yield json.dumps({"done": True, **job['result'], "status_code": job['status_code']}) + '\n'
 
-        folder_path = os.path.join(questions_dir, question_folder)
-        
-        # Compile new LaTeX if content changed
-        if 'content' in data:
-            compilation_result = compile_latex_for_question(data['content'], folder_path)
-            if not compilation_result['success']:
-                return jsonify({
-                    "success": False,
-                    "error": f"LaTeX compilation failed: {compilation_result['error']}"
-                }), 500
-
-        # Update metadata
-        metadata_path = os.path.join(folder_path, 'metadata.json')
-        with open(metadata_path, 'r') as f:
+    return Response(stream(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
+
+def build_worksheet(entries, title, cache_key, events):
+    """Merge the questions' PDFs into a worksheet. Runs on the compile pool.
+
+    Puts a progress line on events for each question and None once it's over.
+    """
+    try:
+        pdf_paths = []
+        for index, entry in enumerate(entries):
+            metadata = entry['metadata']
+            pdf_path = os.path.join(entry['folder_path'], 'question.pdf')
+            source = 'pdf'
+            if file_digest(pdf_path) is None:
+                # Its PDF is gone; compile it again (usually a copy from the compile cache)
+                compilation_result = compile_latex_for_question(metadata.get('content', ''), entry['folder_path'])
+                if not compilation_result['success']:
+                    payload, status_code = compile_failure(compilation_result)
+                    return {**payload, "id": metadata['id']}, status_code
+                source = 'compiled'
+            pdf_paths.append(pdf_path)
+            events.put({"index": index, "id": metadata['id'], "source": source})
+
+        temp_folder = os.path.join(TEMP_DIR, str(uuid.uuid4())[:8])
+        os.makedirs(temp_folder, exist_ok=True)
+        with temp_reaper.claim(temp_folder):
+            tex_path = os.path.join(temp_folder, 'worksheet.tex')
+            pdf_path = os.path.join(temp_folder, 'worksheet.pdf')
+            with open(tex_path, 'w', encoding='utf-8') as f:
+                f.write(worksheet_document(pdf_paths, title))
+            with time_stage('worksheet_merge'):
+                process = run_pdflatex(tex_path, temp_folder)
+
+            if process.returncode != 0 or not os.path.exists(pdf_path):
+                shutil.rmtree(temp_folder, ignore_errors=True)
+                if process.limit_error:
+                    error_code, message = LIMIT_ERRORS[process.limit_error]
+                    return {"success": False, "error": message.format(**COMPILE_LIMITS), "error_code": error_code}, 422
+                return {"success": False, "error": f"Merging the question PDFs failed: {process.stdout[-500:]}"}, 500
+
+            worksheet_cache.put_pdf(cache_key, pdf_path)
+            for name in os.listdir(temp_folder):
+                if name != 'worksheet.pdf':
+                    os.unlink(os.path.join(temp_folder, name))
+        return worksheet_result(pdf_path, len(entries), cached=False), 200
+    finally:
+        events.put(None)
+
+def worksheet_result(pdf_path, count, cached):
+    pdf_file = os.path.relpath(pdf_path, 'storage')
+    pdf_hash = file_digest(pdf_path)
+    return {
+        "success": True,
+        "questions": count,
+        "cached": cached,
+        "pdf_file": pdf_file,
+        "pdf_hash": pdf_hash,
+        "pdf_url": f"/pdf/{pdf_file}?v={pdf_hash}"
+    }
+
+@app.route('/export', methods=['GET'])
+def export_questions():
+    """Stream the whole question bank as a compressed tar archive.
+
+    Every question's metadata and PDF; ?sources=1 adds its question.tex.
+    ?format=tar.gz (default), or tar.zst with the zstandard package.
+    Nothing is staged: the archive is written as it is sent.
+    """
+    compression = request.args.get('format', 'tar.gz')
+    if compression not in archive_formats():
+        return jsonify({"success": False, "error": f"format must be one of {', '.join(archive_formats())}"}), 400
+    include_sources = request.args.get('sources') == '1'
+
+    filename = f"hexagym-questions-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{compression}"
+    archive = export_archive(question_store.entries(), include_sources, compression)
+    return Response(stream_with_context(archive),
+                    mimetype='application/gzip' if compression == 'tar.gz' else 'application/zstd',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/import', methods=['POST'])
+def import_questions():
+    """Unpack an archive made by GET /export into the question bank.
+
+    The body is the archive itself, read as it arrives. Every file is
+    checked against the SHA-256 the archive carries for it, and questions
+    whose id is already in the bank are skipped. The response streams one
+    JSON line per question ({"index", "folder", "id", "success"}, with
+    "skipped" or "error"), then a summary line.
+    """
+    try:
+        tar = open_archive(request.stream)
+    except ArchiveError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    results = stream_with_context(json_lines(import_archive(tar)))
+    return Response(results, mimetype='application/x-ndjson')
+
+def import_archive(tar):
+    """Import each question of an open archive, yielding a result for each."""
+    imported = skipped = failed = 0
+    try:
+        for index, (folder, staged, files, error) in enumerate(read_questions(tar, TEMP_DIR)):
+            try:
+                result = import_question(folder, files, error)
+            except Exception as e:
+                result = {"folder": folder, "success": False, "error": str(e)}
+            finally:
+                shutil.rmtree(staged, ignore_errors=True)
+
+            if not result['success']:
+                failed += 1
+            elif result.get('skipped'):
+                skipped += 1
+            else:
+                imported += 1
+            yield {"index": index, **result}
+    except ArchiveError as e:
+        yield {"done": True, "success": False, "error": str(e),
+               "imported": imported, "skipped": skipped, "failed": failed}
+        return
+    yield {"done": True, "success": True, "imported": imported, "skipped": skipped, "failed": failed}
+
+def metadata_problem(metadata):
+    """What is wrong with the shape of a question's metadata, or None.
+
+    The index, the stores and the endpoints rely on these types, so an
+    imported question that doesn't have them would break every listing.
+    points is whatever /questions stored, so strings and null pass too.
+    """
+    for field in ('name', 'content', 'answer'):
+        if not isinstance(metadata.get(field), str):
+            return f"{field} must be a string"
+    for field in ('created_at', 'updated_at'):
+        if field in metadata and not isinstance(metadata[field], str):
+            return f"{field} must be a string"
+    tags = metadata.get('tags', [])
+    if not isinstance(tags, list) or not all(
+            isinstance(tag, dict) and isinstance(tag.get('type'), str) and isinstance(tag.get('value'), (str, int, float))
+            for tag in tags):
+        return "tags must be a list of {type, value} objects"
+    hints = metadata.get('hints', [])
+    if not isinstance(hints, list) or not all(
+            isinstance(hint, dict) and isinstance(hint.get('text', ''), str) and is_scalar(hint.get('points_deduction'))
+            for hint in hints):
+        return "hints must be a list of {text, points_deduction} objects"
+    if not is_scalar(metadata.get('points')):
+        return "points must be a number or a string"
+    if not isinstance(metadata.get('version', 1), int) or isinstance(metadata.get('version'), bool):
+        return "version must be an integer"
+    if not isinstance(metadata.get('files', {}), dict):
+        return "files must be an object"
+    return None
+
+def is_scalar(value):
+    return value is None or isinstance(value, (str, int, float))
+
+def import_question(folder, files, error):
+    """Move one unpacked question into the bank, unless it's there already."""
+    result = {"folder": folder, "success": False}
+    if error:
+        return {**result, "error": error}
+    if METADATA_FILE not in files or PDF_FILE not in files:
+        return {**result, "error": f"{METADATA_FILE} and {PDF_FILE} are required"}
+    try:
+        with open(files[METADATA_FILE], 'r', encoding='utf-8') as f:
             metadata = json.load(f)
+    except ValueError as e:
+        return {**result, "error": f"Invalid {METADATA_FILE}: {e}"}
 
-        # Update fields
-        metadata.update({
-            "name": data.get('name', metadata['name']),
-            "tags": data.get('tags', metadata['tags']),
-            "points": data.get('points', metadata['points']),
-            "hints": data.get('hints', metadata['hints']),
-            "answer": data.get('answer', metadata['answer']),
-            "content": data.get('content', metadata['content']),  # Update raw LaTeX content
-            "updated_at": datetime.now().isoformat()
-        })
+    question_id = metadata.get('id') if isinstance(metadata, dict) else None
+    result["id"] = question_id
+    if not isinstance(question_id, str) or sanitize_filename(folder) != folder or \
+            QuestionIndex.id_from_folder(folder) != question_id:
+        return {**result, "error": "Folder must be named <name>_<id> after the question's id"}
+    if question_store.get(question_id):
+        return {**result, "success": True, "skipped": True}
+    problem = metadata_problem(metadata)
+    if problem:
+        return {**result, "error": f"Invalid {METADATA_FILE}: {problem}"}
 
-        if 'content' in data:
-            metadata['files'] = {
-                "tex": os.path.relpath(compilation_result['tex_path'], 'storage'),
-                "pdf": os.path.relpath(compilation_result['pdf_path'], 'storage')
-            }
+    folder_path = os.path.join(QUESTIONS_DIR, folder)
+    try:
+        os.makedirs(folder_path)
+    except FileExistsError:
+        return {**result, "success": True, "skipped": True}
 
-        # Save updated metadata
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+    # The files go in first; saving the metadata is what makes the question appear
+    for name, path in files.items():
+        if name != METADATA_FILE:
+            shutil.move(path, os.path.join(folder_path, name))
+    question_store.save(folder_path, metadata)
+    return {**result, "success": True}
 
-        return jsonify({"success": True, "metadata": metadata})
+@app.route('/questions/<question_id>', methods=['PUT'])
+def update_question(question_id):
+    try:
+        data = request.json
+
+        # Find question
+        entry = question_store.get(question_id)
+        if not entry:
+            return jsonify({"success": False, "error": "Question not found"}), 404
+        if 'version' in data and data['version'] != stored_version(entry['metadata']):
+            payload, status_code = version_conflict(stored_version(entry['metadata']))
+            return jsonify(payload), status_code
+
+        # Only updates that change the LaTeX need to go through the compile pool
+        if content_changed(entry['metadata'], data):
+            return run_compile_job(apply_question_update, question_id, data)
+
+        payload, status_code = apply_question_update(question_id, data)
+        return jsonify(payload), status_code
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def content_changed(metadata, data):
+    """Whether an update brings LaTeX that differs from the stored source."""
+    return 'content' in data and data['content'] != metadata.get('content')
+
+def version_conflict(version):
+    return {
+        "success": False,
+        "error": "The question was changed by someone else, reload it and try again",
+        "error_code": "version_conflict",
+        "version": version
+    }, 409
+
+def apply_question_update(question_id, data):
+    """Recompile (if the content changed) and update a question's metadata.
+
+    Nothing is written when no field changed. data may carry the version
+    the editor started from; the update fails with a 409 if the question
+    was saved since, either before or while this one ran.
+    """
+    entry = question_store.get(question_id)
+    if not entry:
+        return {"success": False, "error": "Question not found"}, 404
+    folder_path = entry['folder_path']
+    current = entry['metadata']
+    version = stored_version(current)
+    if 'version' in data and data['version'] != version:
+        return version_conflict(version)
+
+    # Compile new LaTeX if content changed
+    recompile = content_changed(current, data)
+    if recompile:
+        compilation_result = compile_latex_for_question(data['content'], folder_path)
+        if not compilation_result['success']:
+            return compile_failure(compilation_result)
+
+    # Update metadata (a copy, the store's dict is shared)
+    metadata = copy.deepcopy(current)
+
+    # Update fields
+    metadata.update({
+        "name": data.get('name', metadata['name']),
+        "tags": data.get('tags', metadata['tags']),
+        "points": data.get('points', metadata['points']),
+        "hints": data.get('hints', metadata['hints']),
+        "answer": data.get('answer', metadata['answer']),
+        "content": data.get('content', metadata['content'])  # Update raw LaTeX content
+    })
+    changed = [field for field in UPDATABLE_FIELDS if metadata.get(field) != current.get(field)]
+    if not changed:
+        return {"success": True, "metadata": current, "changed": []}, 200
+    metadata["updated_at"] = datetime.now().isoformat()
+    metadata["version"] = version + 1
+
+    if recompile:
+        pdf_hash = file_digest(compilation_result['pdf_path'])
+        metadata['files'] = {
+            "tex": os.path.relpath(compilation_result['tex_path'], 'storage'),
+            "pdf": os.path.relpath(compilation_result['pdf_path'], 'storage'),
+            "pdf_hash": pdf_hash
+        }
+        # A cache hit has no usage of its own; drop the old content's rather than keep it
+        metadata.pop('compile', None)
+        if compile_record(compilation_result):
+            metadata['compile'] = compile_record(compilation_result)
+
+    # Save updated metadata, unless someone else saved first
+    try:
+        question_store.save(folder_path, metadata, expected_version=version)
+    except VersionConflict as e:
+        if recompile:
+            restore_compiled_files(question_id)
+        return version_conflict(e.version)
+
+    if recompile:
+        # Re-rendered only if the PDF actually changed
+        render_previews(compilation_result['pdf_path'], folder_path, pdf_hash)
+
+    return {"success": True, "metadata": metadata, "changed": changed}, 200
+
+def restore_compiled_files(question_id):
+    """Put back the compiled files of the saved version after a losing update overwrote them."""
+    entry = question_store.get(question_id)
+    if entry:
+        # Usually a copy from the compile cache
+        compile_latex_for_question(entry['metadata'].get('content', ''), entry['folder_path'])
+
 @app.route('/questions/<question_id>', methods=['DELETE'])
 def delete_question(question_id):
     try:
-        questions_dir = os.path.join('storage', 'questions')
-        
         # Find question folder
-        question_folder = None
-        for folder in os.listdir(questions_dir):
-            if folder.endswith(question_id):
-                question_folder = folder
-                break
-        
-        if not question_folder:
+        entry = question_store.get(question_id)
+        if not entry:
             return jsonify({"success": False, "error": "Question not found"}), 404
 
-        folder_path = os.path.join(questions_dir, question_folder)
+        folder_path = entry['folder_path']
         
         # Delete all files in the folder
         for file in os.listdir(folder_path):
@@ -259,6 +1396,7 @@ def delete_question(question_id):
 
         # Delete the folder
         os.rmdir(folder_path)
+        question_store.remove(question_id)
 
         return jsonify({"success": True})
 
@@ -267,7 +1405,86 @@ def delete_question(question_id):
 
 @app.route('/pdf/<path:filename>')
 def serve_pdf(filename):
-    return send_file(os.path.join('storage', filename), mimetype='application/pdf')
+    path = safe_join('storage', filename)
+    if (path is None or not path.endswith('.pdf') or not os.path.isfile(path) or
+            not any(path.startswith(f'storage/{folder}/') for folder in PDF_SERVE_DIRS)):
+        return jsonify({"success": False, "error": "PDF not found"}), 404
+    digest = file_digest(path)
+
+    # /pdf/<file>?v=<content hash> names one exact version of the file and never
+    # changes; anything else may change and has to be revalidated
+    response = send_file(path, mimetype='application/pdf', etag=digest or True)
+    if digest and request.args.get('v') == digest:
+        response.headers['Cache-Control'] = f'public, max-age={PDF_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/thumb/<question_id>')
+def serve_thumb(question_id):
+    """PNG/WebP render of a question's first page.
+
+    ?size=thumb (default) or page. The format follows ?format= or, failing
+    that, the Accept header. Like /pdf, ?v=<pdf_hash> makes it immutable.
+    """
+    size = request.args.get('size', 'thumb')
+    if size not in PREVIEW_SIZES:
+        return jsonify({"success": False, "error": f"size must be one of {', '.join(PREVIEW_SIZES)}"}), 400
+    fmt = request.args.get('format')
+    if fmt is None:
+        accepted = request.headers.get('Accept', '')
+        fmt = 'webp' if 'image/webp' in accepted and 'webp' in preview_formats() else 'png'
+    elif fmt not in preview_formats():
+        return jsonify({"success": False, "error": f"format must be one of {', '.join(preview_formats())}"}), 400
+
+    entry = question_store.get(question_id)
+    if not entry:
+        return jsonify({"success": False, "error": "Question not found"}), 404
+    folder_path = entry['folder_path']
+    pdf_path = os.path.join(folder_path, 'question.pdf')
+    pdf_hash = file_digest(pdf_path)
+    if not pdf_hash:
+        return jsonify({"success": False, "error": "Question has no compiled PDF"}), 404
+
+    path = preview_path(folder_path, size, pdf_hash, fmt)
+    # Questions compiled before previews existed are rendered on first request
+    if not os.path.exists(path) and not render_previews(pdf_path, folder_path, pdf_hash):
+        return jsonify({"success": False, "error": "Preview not available"}), 404
+
+    response = send_file(path, mimetype=f'image/{fmt}', etag=f'{pdf_hash}-{size}-{fmt}')
+    if request.args.get('v') == pdf_hash:
+        response.headers['Cache-Control'] = f'public, max-age={PDF_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    if 'format' not in request.args:
+        response.vary.add('Accept')
+    return response
+
+def file_digest(path):
+    """Content hash of a file, memoized on its size and mtime. None if missing."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _file_digests.get(key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()[:32]
+        if len(_file_digests) >= FILE_DIGEST_CACHE_SIZE:
+            _file_digests.clear()
+        _file_digests[key] = digest
+    return digest
+
+def conditional_json(payload):
+    """JSON response with a strong ETag of its body; 304 if the client has it."""
+    response = jsonify(payload)
+    response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:32])
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 @app.route('/compile', methods=['POST'])
 def compile_latex():
@@ -277,98 +1494,282 @@ def compile_latex():
         if not latex_code:
             return jsonify({"success": False, "error": "No LaTeX code provided"}), 400
 
-        # Create a temporary folder for this compilation
-        temp_folder = os.path.join('storage', 'temp', str(uuid.uuid4())[:8])
-        os.makedirs(temp_folder, exist_ok=True)
+        return run_compile_job(compile_preview, latex_code)
 
-        # Compile the LaTeX code
-        result = compile_latex_for_question(latex_code, temp_folder)
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
 
-        if not result['success']:
-            return jsonify({
-                "success": False,
-                "error": result['error'] or "Compilation failed"
-            }), 500
+@app.route('/compile/jobs', methods=['POST'])
+def submit_compile_job():
+    try:
+        data = request.json
+        latex_code = data.get('latex_code')
+        if not latex_code:
+            return jsonify({"success": False, "error": "No LaTeX code provided"}), 400
 
-        # Return the path to the generated PDF
-        pdf_path = os.path.relpath(result['pdf_path'], 'storage')
-        return jsonify({
-            "success": True,
-            "pdf_file": pdf_path
-        })
+        return run_compile_job(compile_preview, latex_code, wait=False)
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/compile/jobs/<job_id>', methods=['GET'])
+def get_compile_job(job_id):
+    job = compile_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify({"success": True, **job})
+
+@app.route('/compile/stream', methods=['POST'])
+def stream_compile():
+    """Compile a preview and stream its progress as Server-Sent Events.
+
+    Events, in order: queued ({job_id}), started, then per pdflatex run
+    pass ({pass}), page ({pass, page}) as pages are shipped out and error
+    ({pass, message, line, content_line, context}) for the first error,
+    and finally done with the same payload /compile answers with, plus
+    status_code and pdf_url.
+    """
+    data = request.get_json(silent=True) or {}
+    latex_code = data.get('latex_code')
+    if not latex_code:
+        return jsonify({"success": False, "error": "No LaTeX code provided"}), 400
+
+    events = queue.Queue()
+    try:
+        job_id = compile_jobs.submit(compile_preview_with_events, latex_code, events)
+    except QueueFull:
+        return jsonify({
+            "success": False,
+            "error": "Too many compilations in progress, please try again shortly"
+        }), 429, {'Retry-After': '2'}
+
+    def stream():
+        yield server_sent_event('queued', {"job_id": job_id})
+        while True:
+            try:
+                event = events.get(timeout=SSE_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                # Comment line, keeps proxies from closing a quiet connection
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                break
+            yield server_sent_event(*event)
+
+        job = compile_jobs.wait(job_id)
+        result = {**job['result'], "status_code": job['status_code']}
+        if result.get('success'):
+            result['pdf_url'] = f"/pdf/{result['pdf_file']}?v={result['pdf_hash']}"
+        yield server_sent_event('done', result)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def compile_preview_with_events(latex_code, events):
+    """compile_preview, putting its progress on events and None once it's over."""
+    try:
+        events.put(('started', {}))
+        return compile_preview(latex_code, lambda name, payload: events.put((name, payload)))
+    finally:
+        events.put(None)
+
+def server_sent_event(name, payload):
+    return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+def compile_preview(latex_code, on_event=None):
+    """Compile a preview into its own temp folder. Runs on the compile pool."""
+    # Create a temporary folder for this compilation
+    temp_folder = os.path.join(TEMP_DIR, str(uuid.uuid4())[:8])
+    os.makedirs(temp_folder, exist_ok=True)
+
+    # Compile the LaTeX code
+    with temp_reaper.claim(temp_folder):
+        result = compile_latex_for_question(latex_code, temp_folder, on_event)
+
+    if not result['success']:
+        if not PREVIEW_KEEP_BUILD_FILES:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+        payload = {"success": False, "error": result['error'] or "Compilation failed"}
+        if result.get('error_code'):
+            payload["error_code"] = result['error_code']
+            return payload, 422
+        return payload, 500
+
+    if not PREVIEW_KEEP_BUILD_FILES:
+        for name in os.listdir(temp_folder):
+            path = os.path.join(temp_folder, name)
+            if name != 'question.pdf' and os.path.isfile(path):
+                os.unlink(path)
+
+    # Return the path to the generated PDF
+    pdf_path = os.path.relpath(result['pdf_path'], 'storage')
+    return {
+        "success": True,
+        "pdf_file": pdf_path,
+        "pdf_hash": file_digest(result['pdf_path']),
+        "passes": result['passes'],
+        "usage": result.get('usage')
+    }, 200
+
+def run_compile_job(fn, *args, wait=None):
+    """Run fn(*args) on the compile pool and answer with its result.
+
+    With wait=False (or ?async=1 on the request) the job id is returned right
+    away and the result is fetched from GET /compile/jobs/<id>.
+    """
+    if wait is None:
+        wait = request.args.get('async') != '1'
+
+    try:
+        job_id = compile_jobs.submit(fn, *args)
+    except QueueFull:
+        return jsonify({
+            "success": False,
+            "error": "Too many compilations in progress, please try again shortly"
+        }), 429, {'Retry-After': '2'}
+
+    if not wait:
+        return jsonify({
+            "success": True,
+            "job_id": job_id,
+            "status_url": f"/compile/jobs/{job_id}"
+        }), 202
+
+    job = compile_jobs.wait(job_id)
+    return jsonify(job['result']), job['status_code']
+
+@app.route('/compile/cache', methods=['GET'])
+def compile_cache_stats():
+    return jsonify(compile_cache.stats())
+
+@app.route('/compile/stats', methods=['GET'])
+def compile_queue_stats():
+    stats = {**compile_jobs.stats(), **compile_flights.stats(), "temp": temp_reaper.stats()}
+    if warm_pool is not None:
+        stats["warm_pool"] = warm_pool.stats()
+    if figure_cache is not None:
+        stats["figures"] = figure_cache.stats()
+    stats["worksheets"] = worksheet_cache.stats()
+    return jsonify(stats)
+
 @app.route('/questions/<question_id>', methods=['GET'])
 def get_question(question_id):
     try:
-        questions_dir = os.path.join('storage', 'questions')
-        
-        # Find question folder
-        question_folder = None
-        for folder in os.listdir(questions_dir):
-            if folder.endswith(question_id):
-                question_folder = folder
-                break
-        
-        if not question_folder:
+        # Find question
+        entry = question_store.get(question_id)
+        if not entry:
             return jsonify({"success": False, "error": "Question not found"}), 404
 
-        # Read metadata
-        metadata_path = os.path.join(questions_dir, question_folder, 'metadata.json')
-        with open(metadata_path, 'r') as f:
-            question = json.load(f)
-            
-        return jsonify(question)
+        return conditional_json(entry['metadata'])
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def awarded_points(claimed, metadata):
+    """Points for a correct answer. The client sends what is left after hints
+    and failed attempts; it's trusted only within 0 and the question's points."""
+    if isinstance(claimed, bool) or not isinstance(claimed, (int, float)) or not math.isfinite(claimed):
+        return 0
+    points = min(max(claimed, 0), points_value(metadata))
+    return int(points) if points == int(points) else points
+
 @app.route('/submit-attempt', methods=['POST'])
 def submit_attempt():
     try:
         data = request.json
+        user_id = data.get('userId') or 'anonymous'
         question_id = data.get('questionId')
         answer = data.get('answer')
         time_spent = data.get('timeSpent')
         points_earned = data.get('pointsEarned')
+        try:
+            seconds_spent = parse_time_spent(time_spent)
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
 
         # Get the question to check the answer
-        questions_dir = os.path.join('storage', 'questions')
-        question_folder = None
-        for folder in os.listdir(questions_dir):
-            if folder.endswith(question_id):
-                question_folder = folder
-                break
-        
-        if not question_folder:
+        entry = question_store.get(question_id)
+        if not entry:
             return jsonify({"success": False, "error": "Question not found"}), 404
 
-        # Read metadata to get correct answer
-        metadata_path = os.path.join(questions_dir, question_folder, 'metadata.json')
-        with open(metadata_path, 'r') as f:
-            question = json.load(f)
-            
+        question = entry['metadata']
+
         # Simple string comparison for now
         # In a real application, you might want more sophisticated answer checking
         is_correct = answer.strip().lower() == question['answer'].strip().lower()
+        points_earned = awarded_points(points_earned, question) if is_correct else 0
 
-        # In a real application, you would:
-        # 1. Save the attempt to a database
-        # 2. Mark the question as completed if correct
-        # 3. Store the points earned and time spent
-        # 4. Store failed attempts count
+        # Journal the attempt; progress (completion, points, time, failed
+        # attempts) is aggregated from it
+        get_attempt_journal().append({
+            "at": datetime.now().isoformat(),
+            "user": user_id,
+            "question": question_id,
+            "correct": is_correct,
+            "points_earned": points_earned,
+            "time_spent": seconds_spent,
+            "answer": answer
+        })
 
         return jsonify({
             "success": True,
             "isCorrect": is_correct,
             "message": "Correct answer!" if is_correct else "Incorrect answer",
-            "points_earned": points_earned if is_correct else 0,
+            "points_earned": points_earned,
             "time_spent": time_spent
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/users/<user_id>/progress', methods=['GET'])
+def get_user_progress(user_id):
+    progress = get_attempt_journal().progress(user_id)
+    return jsonify({
+        "success": True,
+        "user": user_id,
+        "solved": sum(1 for p in progress.values() if p['solved']),
+        "attempts": sum(p['attempts'] for p in progress.values()),
+        "points_earned": sum(p['points_earned'] for p in progress.values()),
+        "questions": progress
+    })
+
+@app.route('/users/<user_id>/progress/<question_id>', methods=['GET'])
+def get_user_question_progress(user_id, question_id):
+    progress = get_attempt_journal().progress(user_id).get(question_id)
+    if progress is None:
+        return jsonify({"success": False, "error": "No attempts for this question"}), 404
+    return jsonify({"success": True, "user": user_id, "question": question_id, **progress})
+
+@app.route('/stats/questions/<question_id>', methods=['GET'])
+def get_question_stats(question_id):
+    if question_store.get(question_id) is None:
+        return jsonify({"success": False, "error": "Question not found"}), 404
+    stats = get_attempt_journal().question_stats(question_id)
+    if stats is None:
+        # Not attempted yet: same shape, nothing counted
+        stats = summarize_question_stats(new_question_stats())
+    return jsonify({"success": True, "question": question_id, **stats})
+
+@app.route('/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """Top users by points earned. ?limit=&offset= page the board, ?user= adds that user's rank."""
+    try:
+        limit = min(int(request.args.get('limit', LEADERBOARD_PAGE_SIZE)), QUESTION_PAGE_MAX)
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({"success": False, "error": "limit and offset must be numbers"}), 400
+    if limit < 1 or offset < 0:
+        return jsonify({"success": False, "error": "limit must be positive and offset non-negative"}), 400
+
+    journal = get_attempt_journal()
+    entries, total = journal.leaderboard(limit, offset)
+    response = {"success": True, "leaderboard": entries, "total": total}
+    user_id = request.args.get('user')
+    if user_id:
+        response['user'] = journal.rank(user_id)
+    return jsonify(response)
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
+    # Build the preamble format up front so the first compile doesn't pay for it
+    ensure_preamble_format()
+    app.run(host='0.0.0.0', port=int(os.environ.get('HEXAGYM_PORT', '5000')), debug=True) 
\ No newline at end of file
@@ -0,0 +1,481 @@
+import os
+import json
+import math
+import time
+import glob
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: start_server.py runs a single server process there
+    fcntl = None
+from attempt_stats import Leaderboard, new_question_stats, dump_question_stats, load_question_stats, summarize_question_stats
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+def new_progress():
+    """Aggregate of one user's attempts at one question."""
+    return {
+        'attempts': 0,
+        'failed_attempts': 0,
+        'solved': False,
+        'points_earned': 0,
+        'time_spent': 0,
+        'first_attempt_at': None,
+        'last_attempt_at': None,
+        'solved_at': None
+    }
+
+def fold(aggregates, record, questions=None):
+    """Apply one attempt record to {user: {question: progress}}.
+
+    If questions is given, the per-question stats in it ({question: stats},
+    see attempt_stats) are updated too. Returns the change in the user's
+    (points earned, questions solved), for the leaderboard.
+    """
+    user_progress = aggregates.setdefault(record['user'], {})
+    first_attempt = record['question'] not in user_progress
+    progress = user_progress.setdefault(record['question'], new_progress())
+    progress['attempts'] += 1
+    time_spent = record.get('time_spent') or 0
+    if not math.isfinite(time_spent) or time_spent < 0:
+        # Journaled before submissions were checked for it
+        time_spent = 0
+    progress['time_spent'] += time_spent
+    progress['last_attempt_at'] = record['at']
+    if progress['first_attempt_at'] is None:
+        progress['first_attempt_at'] = record['at']
+
+    points_before = progress['points_earned']
+    first_solve = False
+    if record['correct']:
+        if not progress['solved']:
+            progress['solved'] = True
+            progress['solved_at'] = record['at']
+            first_solve = True
+        progress['points_earned'] = max(progress['points_earned'], record.get('points_earned') or 0)
+    else:
+        progress['failed_attempts'] += 1
+    points_delta = progress['points_earned'] - points_before
+
+    if questions is not None:
+        stats = questions.setdefault(record['question'], new_question_stats())
+        stats['attempts'] += 1
+        stats['points_earned_total'] += points_delta
+        if first_attempt:
+            stats['attempted_by'] += 1
+        if record['correct']:
+            stats['correct_attempts'] += 1
+        if first_solve:
+            stats['solved_by'] += 1
+            stats['solve_time'].add(progress['time_spent'])
+
+    return points_delta, 1 if first_solve else 0
+
+def backfill_question_stats(aggregates):
+    """Per-question stats rebuilt from per-user progress, for old snapshots.
+
+    Approximate: time spent after a user's first solve counts toward their
+    solve time, since the snapshot no longer has the individual attempts.
+    """
+    questions = {}
+    for progress_by_question in aggregates.values():
+        for question, progress in progress_by_question.items():
+            stats = questions.setdefault(question, new_question_stats())
+            stats['attempts'] += progress['attempts']
+            stats['correct_attempts'] += progress['attempts'] - progress['failed_attempts']
+            stats['attempted_by'] += 1
+            stats['points_earned_total'] += progress['points_earned']
+            if progress['solved']:
+                stats['solved_by'] += 1
+                stats['solve_time'].add(progress['time_spent'])
+    return questions
+
+class AttemptJournal:
+    """Append-only log of answer attempts with group-committed writes.
+
+    append() buffers a record and updates the in-memory aggregates right
+    away; a writer thread flushes the buffer to the current journal segment
+    in batches. The fsync policy decides durability:
+
+    - 'always': append() returns once its batch is fsynced (one fsync per
+      batch, shared by every attempt in it)
+    - 'interval': fsync at most every fsync_interval seconds, don't wait
+    - 'never': leave flushing to the OS
+
+    Segments past segment_bytes are closed and, once compact_after of them
+    pile up, folded into snapshot.json and deleted.
+
+    Alongside each user's progress the journal keeps per-question stats
+    and a leaderboard, updated as attempts are appended, so reading them
+    never means scanning the history.
+
+    Several server processes can share one journal directory. Each process
+    writes only to segments it claimed (and holds a lock on while they are
+    open) and folds in what the others wrote, checked at most every
+    refresh_interval seconds before answering a read.
+    """
+
+    def __init__(self, journal_dir, fsync='interval', fsync_interval=1.0,
+                 segment_bytes=16 * 1024 * 1024, compact_after=4, refresh_interval=1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.compact_after = compact_after
+        self.refresh_interval = refresh_interval
+        self.appended = 0
+        self.batches = 0
+        self.fsyncs = 0
+        self.reloads = 0
+
+        self._aggregates = {}
+        self._questions = {}
+        self._leaderboard = Leaderboard()
+        self._own = set()  # names of segments this process wrote
+        self._consumed = {}  # segment name -> bytes folded in, for other processes' segments
+        self._snapshot_id = None
+        self._checked_at = time.monotonic()
+        self._buffer = []
+        self._appended_seq = 0
+        self._durable_seq = 0
+        self._last_fsync = time.monotonic()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._compact_lock = threading.Lock()
+
+        os.makedirs(journal_dir, exist_ok=True)
+        with self._lock:
+            self._load()
+
+        # Always start a fresh segment so new lines never follow a torn one
+        self._segment = self._claim_segment()
+        self._compact_if_due()
+
+        self._writer = threading.Thread(target=self._write_loop, name='attempt-journal', daemon=True)
+        self._writer.start()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.journal_dir, f"journal-{seq:08d}.jsonl")
+
+    def _segments(self):
+        """[(seq, path)] of journal segments on disk, oldest first."""
+        segments = []
+        for path in glob.glob(os.path.join(self.journal_dir, 'journal-*.jsonl')):
+            seq = int(os.path.basename(path)[len('journal-'):-len('.jsonl')])
+            segments.append((seq, path))
+        return sorted(segments)
+
+    @staticmethod
+    def _is_folded(snapshot, seq, path):
+        # Snapshots from before multi-process support only record a sequence cutoff
+        return seq <= snapshot['segment'] or os.path.basename(path) in snapshot['folded']
+
+    def _claim_segment(self):
+        """Create and lock the next unused segment, safe against other processes claiming one."""
+        # List before reading the snapshot: compaction writes the snapshot
+        # before deleting segments, so every folded number is seen in one of them
+        segments = self._segments()
+        snapshot = self._read_snapshot()
+        seq = max([snapshot['segment']] + [s for s, _ in segments] +
+                  [int(name[len('journal-'):-len('.jsonl')]) for name in snapshot['folded']]) + 1
+
+        while True:
+            path = self._segment_path(seq)
+            if fcntl is None:
+                try:
+                    f = open(path, 'xb')
+                    break
+                except FileExistsError:
+                    seq += 1
+                    continue
+
+            # Lock the file before it appears under its segment name, so a
+            # compaction never mistakes a brand-new segment for a closed one
+            claim_path = os.path.join(self.journal_dir, f".claim-{os.getpid()}-{threading.get_ident()}")
+            f = open(claim_path, 'wb')
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                os.link(claim_path, path)
+                break
+            except FileExistsError:
+                f.close()
+                seq += 1
+            finally:
+                os.unlink(claim_path)
+
+        with self._lock:
+            self._own.add(os.path.basename(path))
+            self._segment_seq = seq
+        return f
+
+    def _is_closed(self, path):
+        """Whether no process is writing to a segment any more."""
+        if os.path.basename(path) == os.path.basename(self._segment_path(self._segment_seq)):
+            return False
+        if fcntl is None:
+            return True
+        try:
+            with open(path, 'rb') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+        except BlockingIOError:
+            return False
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _replay(aggregates, questions, path, offset=0, on_record=None):
+        """Fold the complete lines of a segment from offset on.
+
+        Returns the offset just past the last complete line; a trailing
+        partial line is still being written (or was torn by a crash).
+        """
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            deltas = fold(aggregates, record, questions)
+            if on_record:
+                on_record(record, deltas)
+        return offset + end
+
+    def _snapshot_path(self):
+        return os.path.join(self.journal_dir, 'snapshot.json')
+
+    def _read_snapshot(self):
+        path = self._snapshot_path()
+        if not os.path.exists(path):
+            return {'segment': 0, 'folded': {}, 'aggregates': {}, 'questions': {}}
+        with open(path, 'r') as f:
+            snapshot = json.load(f)
+        snapshot.setdefault('folded', {})
+        if 'questions' not in snapshot:
+            # Written before per-question stats existed
+            snapshot['questions'] = dump_question_stats(backfill_question_stats(snapshot['aggregates']))
+        return snapshot
+
+    def _current_snapshot_id(self):
+        try:
+            st = os.stat(self._snapshot_path())
+            return (st.st_ino, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        """Rebuild all state from the snapshot plus the segments not in it. Caller holds the lock."""
+        segments = self._segments()
+        self._snapshot_id = self._current_snapshot_id()
+        snapshot = self._read_snapshot()
+        self._aggregates = snapshot['aggregates']
+        self._questions = load_question_stats(snapshot['questions'])
+        self._consumed = dict(snapshot['folded'])
+        for seq, path in segments:
+            if self._is_folded(snapshot, seq, path):
+                continue
+            try:
+                self._consumed[os.path.basename(path)] = self._replay(self._aggregates, self._questions, path)
+            except FileNotFoundError:
+                # Compacted meanwhile; caught up on at the next refresh
+                pass
+
+        self._leaderboard = Leaderboard()
+        for user, progress in self._aggregates.items():
+            self._leaderboard.update(
+                user,
+                sum(p['points_earned'] for p in progress.values()),
+                sum(1 for p in progress.values() if p['solved'])
+            )
+
+    def _catch_up(self):
+        """Fold in attempts other processes logged since the last check. Caller holds the lock."""
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+
+        segments = self._segments()
+        snapshot_id = self._current_snapshot_id()
+        if snapshot_id != self._snapshot_id:
+            self._snapshot_id = snapshot_id
+            for name, size in self._read_snapshot()['folded'].items():
+                if name in self._own:
+                    continue
+                if self._consumed.get(name, 0) < size:
+                    # Another process compacted lines we never read: start over
+                    self._reload()
+                    return
+                self._consumed[name] = size
+
+        def rank(record, deltas):
+            self._leaderboard.update(record['user'], *deltas)
+
+        for seq, path in segments:
+            name = os.path.basename(path)
+            if name in self._own:
+                continue
+            offset = self._consumed.get(name, 0)
+            try:
+                if os.path.getsize(path) > offset:
+                    self._consumed[name] = self._replay(self._aggregates, self._questions, path, offset, rank)
+            except FileNotFoundError:
+                pass
+
+    def _reload(self):
+        """Rebuild from disk once everything appended here has been written. Caller holds the lock."""
+        while self._durable_seq < self._appended_seq:
+            self._cond.wait()
+        self._load()
+        self.reloads += 1
+
+    def append(self, record):
+        """Log an attempt: {'user', 'question', 'correct', 'points_earned', 'time_spent', 'at', ...}."""
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Attempt journal is closed")
+            points_delta, solved_delta = fold(self._aggregates, record, self._questions)
+            self._leaderboard.update(record['user'], points_delta, solved_delta)
+            self._buffer.append(line)
+            self._appended_seq += 1
+            seq = self._appended_seq
+            self.appended += 1
+            self._cond.notify_all()
+
+            if self.fsync == 'always':
+                while self._durable_seq < seq:
+                    self._cond.wait()
+
+    def _write_loop(self):
+        dirty = False  # bytes written since the last fsync
+        while True:
+            with self._cond:
+                if not self._buffer and not self._closed:
+                    self._cond.wait(self.fsync_interval)
+                batch, self._buffer = self._buffer, []
+                batch_seq = self._appended_seq
+                closed = self._closed
+
+            if batch:
+                self._segment.write(b''.join(batch))
+                self._segment.flush()
+                self.batches += 1
+                dirty = True
+            if dirty and self._should_fsync(closed):
+                os.fsync(self._segment.fileno())
+                self._last_fsync = time.monotonic()
+                self.fsyncs += 1
+                dirty = False
+
+            with self._cond:
+                self._durable_seq = batch_seq
+                self._cond.notify_all()
+
+            if closed:
+                self._segment.close()
+                return
+            if self._segment.tell() >= self.segment_bytes:
+                self._rotate()
+                dirty = False
+
+    def _should_fsync(self, closing):
+        if self.fsync == 'always':
+            return True
+        if self.fsync == 'interval':
+            return closing or time.monotonic() - self._last_fsync >= self.fsync_interval
+        return False
+
+    def _rotate(self):
+        """Close the current segment and start the next one. Writer thread only."""
+        os.fsync(self._segment.fileno())
+        self._segment.close()
+        self._segment = self._claim_segment()
+        self._compact_if_due()
+
+    def _compact_if_due(self):
+        segments = self._segments()
+        if len(segments) > self.compact_after:
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """Fold every closed segment into the snapshot, then delete them."""
+        with self._compact_lock, open(os.path.join(self.journal_dir, 'compact.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+
+            segments = self._segments()
+            snapshot = self._read_snapshot()
+            closed = [(seq, path) for seq, path in segments
+                      if not self._is_folded(snapshot, seq, path) and self._is_closed(path)]
+            if not closed:
+                return
+            questions = load_question_stats(snapshot['questions'])
+            for seq, path in closed:
+                snapshot['folded'][os.path.basename(path)] = self._replay(snapshot['aggregates'], questions, path)
+            snapshot['questions'] = dump_question_stats(questions)
+
+            # Write-then-rename so a crash never leaves a half-written snapshot
+            path = self._snapshot_path()
+            with open(path + '.tmp', 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            for seq, segment_path in closed:
+                try:
+                    os.unlink(segment_path)
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        """Flush everything buffered and stop the writer."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+
+    def progress(self, user):
+        """{question id: progress} for one user."""
+        with self._lock:
+            self._catch_up()
+            return {question: dict(progress) for question, progress in self._aggregates.get(user, {}).items()}
+
+    def question_stats(self, question):
+        """Summary stats of one question, or None if nobody has attempted it."""
+        with self._lock:
+            self._catch_up()
+            stats = self._questions.get(question)
+            return summarize_question_stats(stats) if stats else None
+
+    def leaderboard(self, limit, offset=0):
+        with self._lock:
+            self._catch_up()
+            return self._leaderboard.top(limit, offset), len(self._leaderboard)
+
+    def rank(self, user):
+        with self._lock:
+            self._catch_up()
+            return self._leaderboard.rank(user)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'fsync': self.fsync,
+                'appended': self.appended,
+                'batches': self.batches,
+                'fsyncs': self.fsyncs,
+                'buffered': len(self._buffer),
+                'segment': self._segment_seq,
+                'reloads': self.reloads
+            }
@@ -0,0 +1,133 @@
+import math
+import bisect
+
+class QuantileSketch:
+    """Streaming quantile estimate with bounded relative error.
+
+    Values are counted in logarithmic buckets (the DDSketch idea): every
+    quantile is answered within relative_accuracy of the true value, and the
+    sketch stays a few hundred integers no matter how many values it saw.
+    """
+
+    def __init__(self, relative_accuracy=0.02):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        if not math.isfinite(value) or value < 0:
+            raise ValueError(f"Cannot add {value} to a quantile sketch")
+        if value == 0:
+            self.zeros += 1
+        else:
+            key = math.ceil(math.log(value) / self.log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimated q-quantile (0 <= q <= 1), or None if empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'buckets': {str(key): count for key, count in self.buckets.items()},
+            'zeros': self.zeros,
+            'count': self.count
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'])
+        sketch.buckets = {int(key): count for key, count in data['buckets'].items()}
+        sketch.zeros = data['zeros']
+        sketch.count = data['count']
+        return sketch
+
+def new_question_stats():
+    """Running totals for one question."""
+    return {
+        'attempts': 0,
+        'correct_attempts': 0,
+        'attempted_by': 0,
+        'solved_by': 0,
+        'points_earned_total': 0,
+        'solve_time': QuantileSketch()
+    }
+
+def dump_question_stats(questions):
+    """JSON-ready copy of {question: stats} (sketches as dicts)."""
+    return {q: {**stats, 'solve_time': stats['solve_time'].to_dict()} for q, stats in questions.items()}
+
+def load_question_stats(data):
+    return {q: {**stats, 'solve_time': QuantileSketch.from_dict(stats['solve_time'])} for q, stats in data.items()}
+
+def summarize_question_stats(stats):
+    """Public view of a question's running totals."""
+    sketch = stats['solve_time']
+
+    def rounded(value):
+        return round(value, 1) if value is not None else None
+
+    return {
+        'attempts': stats['attempts'],
+        'correct_attempts': stats['correct_attempts'],
+        'accuracy': stats['correct_attempts'] / stats['attempts'] if stats['attempts'] else None,
+        'attempted_by': stats['attempted_by'],
+        'solved_by': stats['solved_by'],
+        'solve_rate': stats['solved_by'] / stats['attempted_by'] if stats['attempted_by'] else None,
+        'median_time_to_solve': rounded(sketch.quantile(0.5)),
+        'p90_time_to_solve': rounded(sketch.quantile(0.9)),
+        'average_points_earned': stats['points_earned_total'] / stats['solved_by'] if stats['solved_by'] else None
+    }
+
+class Leaderboard:
+    """Users ranked by points earned, then questions solved.
+
+    Kept as a sorted list so the top of the board is a slice and a user's
+    rank is a binary search.
+    """
+
+    def __init__(self):
+        self._totals = {}  # user -> (points, solved)
+        self._ranking = []  # sorted (-points, -solved, user)
+
+    def update(self, user, points_delta, solved_delta):
+        points, solved = self._totals.get(user, (0, 0))
+        if user in self._totals:
+            i = bisect.bisect_left(self._ranking, (-points, -solved, user))
+            del self._ranking[i]
+        points += points_delta
+        solved += solved_delta
+        self._totals[user] = (points, solved)
+        bisect.insort(self._ranking, (-points, -solved, user))
+
+    def top(self, limit, offset=0):
+        return [
+            {'rank': offset + i + 1, 'user': user, 'points': -points, 'solved': -solved}
+            for i, (points, solved, user) in enumerate(self._ranking[offset:offset + limit])
+        ]
+
+    def rank(self, user):
+        """The user's entry on the board, or None if they haven't attempted anything."""
+        if user not in self._totals:
+            return None
+        points, solved = self._totals[user]
+        i = bisect.bisect_left(self._ranking, (-points, -solved, user))
+        return {'rank': i + 1, 'user': user, 'points': points, 'solved': solved}
+
+    def __len__(self):
+        return len(self._ranking)
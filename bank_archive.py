@@ -0,0 +1,189 @@
+import os
+import io
+import json
+import time
+import shutil
+import hashlib
+import tarfile
+
+try:
+    import zstandard
+except ImportError:
+    # Without it archives are tar.gz only
+    zstandard = None
+
+# Archives are tar streams: both ends read and write them front to back, so
+# neither side ever holds more than one file of the bank at a time
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+CHUNK_SIZE = 64 * 1024
+
+# Everything of a question lives under questions/<folder>/ in the archive,
+# metadata.json first. Build files, previews and figures are left out;
+# sources only on request.
+ARCHIVE_ROOT = 'questions'
+METADATA_FILE = 'metadata.json'
+PDF_FILE = 'question.pdf'
+SOURCE_FILE = 'question.tex'
+# PAX header holding the SHA-256 of each member's content
+DIGEST_HEADER = 'HEXAGYM.sha256'
+
+class ArchiveError(Exception):
+    """The uploaded archive can't be read."""
+
+def archive_formats():
+    """Compressions export_archive can write, default first."""
+    return ('tar.gz', 'tar.zst') if zstandard is not None else ('tar.gz',)
+
+class _Sink:
+    """File-like that collects what tarfile writes until the generator hands it out."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        if data:
+            self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def export_archive(questions, include_sources=False, compression='tar.gz'):
+    """Yield a compressed tar of (folder_path, metadata) questions, chunk by chunk."""
+    sink = _Sink()
+    if compression == 'tar.zst':
+        compressor = zstandard.ZstdCompressor().stream_writer(sink, closefd=False)
+        tar = tarfile.open(fileobj=compressor, mode='w|', format=tarfile.PAX_FORMAT)
+    else:
+        compressor = None
+        tar = tarfile.open(fileobj=sink, mode='w|gz', format=tarfile.PAX_FORMAT)
+
+    def add(name, fileobj, size, digest, mtime):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = mtime
+        info.pax_headers = {DIGEST_HEADER: digest}
+        tar.addfile(info, fileobj)
+
+    for folder_path, metadata in questions:
+        folder = os.path.basename(folder_path)
+        data = json.dumps(metadata, indent=2).encode('utf-8')
+        add(f"{ARCHIVE_ROOT}/{folder}/{METADATA_FILE}", io.BytesIO(data), len(data),
+            hashlib.sha256(data).hexdigest(), time.time())
+
+        for name in (PDF_FILE, SOURCE_FILE) if include_sources else (PDF_FILE,):
+            path = os.path.join(folder_path, name)
+            try:
+                # Hashed before it's added: the digest goes in the member's header
+                digest = file_sha256(path)
+                stat = os.stat(path)
+                with open(path, 'rb') as f:
+                    add(f"{ARCHIVE_ROOT}/{folder}/{name}", f, stat.st_size, digest, stat.st_mtime)
+            except FileNotFoundError:
+                continue
+        yield sink.drain()
+
+    tar.close()
+    if compressor is not None:
+        compressor.close()
+    yield sink.drain()
+
+class _Prefixed:
+    """A stream with bytes already read from its start put back in front."""
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size=-1):
+        if self.prefix:
+            if size is None or size < 0:
+                data, self.prefix = self.prefix + self.stream.read(), b''
+                return data
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+            if len(data) < size:
+                data += self.stream.read(size - len(data))
+            return data
+        return self.stream.read(size)
+
+def open_archive(stream):
+    """Open an uploaded tar.gz or tar.zst stream for reading front to back."""
+    magic = stream.read(4)
+    stream = _Prefixed(magic, stream)
+    try:
+        if magic.startswith(GZIP_MAGIC):
+            return tarfile.open(fileobj=stream, mode='r|gz')
+        if magic == ZSTD_MAGIC:
+            if zstandard is None:
+                raise ArchiveError("tar.zst archives need the zstandard package")
+            return tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(stream), mode='r|')
+    except tarfile.TarError as e:
+        raise ArchiveError(f"Not a readable archive: {e}")
+    raise ArchiveError("Expected a tar.gz or tar.zst archive")
+
+def read_questions(tar, staging_dir):
+    """Unpack an archive one question at a time.
+
+    Yields (folder, staged, files, error) per questions/<folder>/ in the
+    archive: staged is a fresh folder under staging_dir that the caller
+    moves or deletes, files maps each name to its unpacked path there, and
+    error is set if a member had no digest or didn't match it.
+    """
+    current = None
+
+    def finish():
+        return current['folder'], current['staged'], current['files'], current['error']
+
+    try:
+        for member in tar:
+            parts = member.name.split('/')
+            if len(parts) != 3 or parts[0] != ARCHIVE_ROOT or parts[2] not in (METADATA_FILE, PDF_FILE, SOURCE_FILE):
+                continue
+            folder, name = parts[1], parts[2]
+            if folder in ('', '.', '..') or not member.isfile():
+                continue
+
+            if current is None or current['folder'] != folder:
+                if current is not None:
+                    yield finish()
+                staged = os.path.join(staging_dir, f"import-{os.getpid()}-{time.monotonic_ns()}")
+                os.makedirs(staged)
+                current = {'folder': folder, 'staged': staged, 'files': {}, 'error': None}
+            if current['error']:
+                continue
+
+            # Unpacked in chunks, hashed on the way
+            path = os.path.join(current['staged'], name)
+            hasher = hashlib.sha256()
+            source = tar.extractfile(member)
+            with open(path, 'wb') as f:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+                    f.write(chunk)
+            expected = member.pax_headers.get(DIGEST_HEADER)
+            if expected is None:
+                current['error'] = f"{name} has no {DIGEST_HEADER} header"
+            elif hasher.hexdigest() != expected:
+                current['error'] = f"{name} does not match its SHA-256"
+            else:
+                current['files'][name] = path
+    except (tarfile.TarError, EOFError, OSError) as e:
+        if current is not None:
+            shutil.rmtree(current['staged'], ignore_errors=True)
+        raise ArchiveError(f"Archive is truncated or damaged: {e}")
+
+    if current is not None:
+        yield finish()
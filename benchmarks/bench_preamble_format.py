@@ -0,0 +1,68 @@
+"""Compare compile times with and without the precompiled preamble format.
+
+Usage: python benchmarks/bench_preamble_format.py [rounds]
+
+Compiles every sample question from generate_questions.py, first the plain
+way (pdflatex reads LATEX_PREAMBLE each time) and then against the dumped
+format, and prints the mean and median wall time of each mode. The
+compiles go straight to run_latex_passes, so the compile and figure
+caches are bypassed and every round runs pdflatex.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import app
+from generate_questions import questions
+
+def time_compiles(rounds):
+    """Compile every sample question `rounds` times, return per-compile seconds."""
+    timings = []
+    for _ in range(rounds):
+        for question in questions:
+            folder = tempfile.mkdtemp(prefix='bench_', dir=os.path.join('storage', 'temp'))
+            try:
+                tex_path = os.path.join(folder, 'question.tex')
+                with open(tex_path, 'w', encoding='utf-8') as f:
+                    f.write(app.LATEX_PREAMBLE + question['content'] + app.LATEX_ENDING)
+                start = time.perf_counter()
+                success, error, _, _, _ = app.run_latex_passes(tex_path, folder, os.path.join(folder, 'question.log'))
+                timings.append(time.perf_counter() - start)
+                if not success:
+                    print(f"  {question['name']}: compilation failed: {error}")
+            finally:
+                shutil.rmtree(folder, ignore_errors=True)
+    return timings
+
+def report(label, timings):
+    print(f"{label:>6}: n={len(timings)}  mean={statistics.mean(timings):.3f}s  "
+          f"median={statistics.median(timings):.3f}s  min={min(timings):.3f}s")
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    app.USE_PREAMBLE_FORMAT = False
+    cold = time_compiles(rounds)
+
+    app.USE_PREAMBLE_FORMAT = True
+    start = time.perf_counter()
+    fmt_path = app.ensure_preamble_format()
+    if not fmt_path:
+        print("Could not build the preamble format, nothing to compare")
+        return
+    print(f"Format build: {time.perf_counter() - start:.3f}s ({fmt_path}.fmt)")
+    warm = time_compiles(rounds)
+
+    report('cold', cold)
+    report('warm', warm)
+    print(f"Speedup (median): {statistics.median(cold) / statistics.median(warm):.2f}x")
+
+if __name__ == "__main__":
+    main()
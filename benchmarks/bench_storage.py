@@ -0,0 +1,95 @@
+"""Compare list and lookup latency of the folder and SQLite question stores.
+
+Usage: python benchmarks/bench_storage.py [count ...]
+
+For each bank size, writes `count` synthetic questions into a temporary
+folder layout, imports them into SQLite the same way migrate_storage.py
+does, then times a cold load, a full listing and random id lookups on
+both backends.
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from question_store import FolderQuestionStore, SqliteQuestionStore
+from migrate_storage import migrate
+from generate_questions import questions as sample_questions
+
+LOOKUPS = 2000
+
+def make_bank(questions_dir, count):
+    """Write `count` questions based on the generate_questions.py samples."""
+    store = FolderQuestionStore(questions_dir)
+    ids = []
+    for i in range(count):
+        sample = sample_questions[i % len(sample_questions)]
+        question_id = f"{i:08x}"
+        folder_path = os.path.join(questions_dir, f"bench_question_{question_id}")
+        os.makedirs(folder_path)
+        store.save(folder_path, {
+            "id": question_id,
+            "name": f"{sample['name']} #{i}",
+            "created_at": "2025-01-01T00:00:00",
+            "tags": sample['tags'],
+            "points": sample['points'],
+            "hints": sample['hints'],
+            "answer": sample['answer'],
+            "content": sample['content'],
+            "files": {"tex": "", "pdf": ""}
+        })
+        ids.append(question_id)
+    return ids
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def report(label, samples):
+    print(f"  {label:<28} median={statistics.median(samples) * 1000:9.3f}ms  "
+          f"max={max(samples) * 1000:9.3f}ms")
+
+def bench(count):
+    work_dir = tempfile.mkdtemp(prefix='hexagym_bench_')
+    try:
+        questions_dir = os.path.join(work_dir, 'questions')
+        db_path = os.path.join(work_dir, 'questions.db')
+        os.makedirs(questions_dir)
+        ids = make_bank(questions_dir, count)
+        migrate(questions_dir, db_path)
+        lookup_ids = [random.choice(ids) for _ in range(LOOKUPS)]
+
+        print(f"\n{count} questions")
+        folder_load = timed(lambda: FolderQuestionStore(questions_dir), 3)
+        sqlite_load = timed(lambda: SqliteQuestionStore(db_path, questions_dir), 3)
+        folder = FolderQuestionStore(questions_dir)
+        sqlite = SqliteQuestionStore(db_path, questions_dir)
+
+        report('folder: startup load', folder_load)
+        report('sqlite: startup load', sqlite_load)
+        report('folder: list all', timed(folder.all, 10))
+        report('sqlite: list all', timed(sqlite.all, 10))
+        report('folder: lookup by id',
+               [s / LOOKUPS for s in timed(lambda: [folder.get(i) for i in lookup_ids], 3)])
+        report('sqlite: lookup by id',
+               [s / LOOKUPS for s in timed(lambda: [sqlite.get(i) for i in lookup_ids], 3)])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]
+    for count in counts:
+        bench(count)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Compile latency of the warm TeX worker pool against subprocess compiles.
+
+Usage: python benchmarks/bench_warm_pool.py [rounds] [workers]
+
+Compiles every sample question from generate_questions.py `rounds` times
+(default 3) in each of three modes and prints p50/p99 latency:
+
+- two-pass: two plain `pdflatex` runs through subprocess.run, as compiles
+  used to work before the preamble format and rerun detection
+- subprocess: run_latex_passes, the default engine
+- warm: run_latex_passes with a pool of `workers` parked TeX processes
+  (default 2). Before each compile the script waits for a parked worker,
+  so this is the latency of a compile that finds one; the pool's hit and
+  miss counts are printed as well.
+
+The compile cache is bypassed in every mode.
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import app
+from tex_pool import WarmTexPool
+from generate_questions import questions
+
+def two_pass(folder, tex_path, latex_code):
+    for _ in range(2):
+        subprocess.run(['pdflatex', '-interaction=nonstopmode', '-output-directory', folder, tex_path],
+                       capture_output=True, text=True)
+
+def engine_compile(folder, tex_path, latex_code):
+    log_path = os.path.join(folder, 'question.log')
+    success, error, _, _, _ = app.run_latex_passes(tex_path, folder, log_path, latex_code=latex_code)
+    if not success:
+        print(f"  compilation failed: {error}")
+
+def time_compiles(compile_fn, rounds, before=None):
+    timings = []
+    for _ in range(rounds):
+        for question in questions:
+            folder = tempfile.mkdtemp(prefix='bench_', dir=os.path.join('storage', 'temp'))
+            try:
+                tex_path = os.path.join(folder, 'question.tex')
+                with open(tex_path, 'w', encoding='utf-8') as f:
+                    f.write(app.LATEX_PREAMBLE + question['content'] + app.LATEX_ENDING)
+                if before:
+                    before()
+                start = time.perf_counter()
+                compile_fn(folder, tex_path, question['content'])
+                timings.append(time.perf_counter() - start)
+            finally:
+                shutil.rmtree(folder, ignore_errors=True)
+    return timings
+
+def report(label, timings):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{label:>10}: n={len(timings)}  p50={statistics.median(timings) * 1000:8.1f}ms  "
+          f"p99={p99 * 1000:8.1f}ms  mean={statistics.mean(timings) * 1000:8.1f}ms")
+
+def wait_for_worker(pool):
+    deadline = time.monotonic() + 30
+    while pool.stats()['idle'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    if shutil.which('pdflatex') is None:
+        print("pdflatex not found")
+        sys.exit(1)
+
+    report('two-pass', time_compiles(two_pass, rounds))
+
+    app.warm_pool = None
+    report('subprocess', time_compiles(engine_compile, rounds))
+
+    pool = WarmTexPool(workers, os.path.join('storage', 'cache', 'warm-bench'),
+                       app.LATEX_PREAMBLE, app.LATEX_ENDING, app.COMPILE_LIMITS)
+    app.warm_pool = pool
+    try:
+        pool.prime(app.ensure_preamble_format())
+        report('warm', time_compiles(engine_compile, rounds, before=lambda: wait_for_worker(pool)))
+        stats = pool.stats()
+        print(f"{'':>10}  warm pool: {stats['hits']} hits, {stats['misses']} misses")
+    finally:
+        pool.close()
+        shutil.rmtree(pool.work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
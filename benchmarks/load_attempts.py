@@ -0,0 +1,89 @@
+"""Sustained /submit-attempt throughput for each attempt journal fsync policy.
+
+Usage: python benchmarks/load_attempts.py [threads] [seconds]
+
+Runs against a throwaway storage directory holding a single question.
+`threads` clients submit attempts back to back through the Flask test
+client for `seconds` seconds per policy; the script reports submits per
+second, latency percentiles and how many batches and fsyncs the journal
+needed.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUESTION_ID = 'load0001'
+
+def make_storage(work_dir):
+    folder = os.path.join(work_dir, 'storage', 'questions', f'load_test_{QUESTION_ID}')
+    os.makedirs(folder)
+    with open(os.path.join(folder, 'metadata.json'), 'w') as f:
+        json.dump({"id": QUESTION_ID, "name": "Load test", "tags": [], "points": 5,
+                   "hints": [], "answer": "42", "content": "", "files": {}}, f)
+
+def run(app, threads, seconds):
+    latencies = []
+    stop = time.monotonic() + seconds
+
+    def client(n):
+        c = app.app.test_client()
+        i = 0
+        local = []
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            c.post('/submit-attempt', json={
+                "userId": f"user{n}",
+                "questionId": QUESTION_ID,
+                "answer": "42" if i % 3 == 0 else "41",
+                "timeSpent": "00:30",
+                "pointsEarned": 5
+            })
+            local.append(time.perf_counter() - start)
+            i += 1
+        latencies.extend(local)
+
+    workers = [threading.Thread(target=client, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    work_dir = tempfile.mkdtemp(prefix='hexagym_load_')
+    os.chdir(work_dir)
+    try:
+        make_storage(work_dir)
+        import app
+
+        for policy in ('never', 'interval', 'always'):
+            app.ATTEMPT_FSYNC = policy
+            app.ATTEMPTS_DIR = os.path.join('storage', f'attempts-{policy}')
+            app._attempt_journal = None
+
+            latencies = run(app, threads, seconds)
+            journal = app.get_attempt_journal()
+            journal.close()
+            stats = journal.stats()
+            latencies.sort()
+            print(f"{policy:>8}: {len(latencies) / seconds:8.0f} submits/s  "
+                  f"p50={statistics.median(latencies) * 1000:.2f}ms  "
+                  f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms  "
+                  f"batches={stats['batches']}  fsyncs={stats['fsyncs']}")
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Request throughput of the development server against production mode.
+
+Usage: python benchmarks/load_server.py [clients] [seconds] [workers] [threads]
+
+Starts each server in turn on a free local port, running from a throwaway
+copy of storage/questions, and has `clients` threads send a mix of
+requests over keep-alive connections for `seconds` seconds: question
+listings, single questions, PDFs and answer submissions. Reports
+requests per second, latency percentiles and errors for each server.
+`workers` and `threads` size the production server (default 4 and 8).
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import statistics
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def make_storage(work_dir):
+    """Copy the question bank so submissions don't touch the real storage."""
+    shutil.copytree(os.path.join(ROOT, 'storage', 'questions'), os.path.join(work_dir, 'storage', 'questions'))
+    questions = []
+    for folder in os.listdir(os.path.join(work_dir, 'storage', 'questions')):
+        try:
+            with open(os.path.join(work_dir, 'storage', 'questions', folder, 'metadata.json')) as f:
+                questions.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return questions
+
+def start_server(mode, port, work_dir, workers, threads):
+    env = dict(os.environ, PYTHONPATH=ROOT, HEXAGYM_PORT=str(port))
+    if mode == 'dev':
+        # What `python start_server.py` runs, minus the reloader
+        command = [sys.executable, '-c',
+                   f"import app; app.app.run(host='127.0.0.1', port={port}, debug=True, use_reloader=False)"]
+    else:
+        command = [sys.executable, os.path.join(ROOT, 'start_server.py'), '--production',
+                   '--port', str(port), '--workers', str(workers), '--threads', str(threads)]
+    process = subprocess.Popen(command, cwd=work_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{mode} server did not start")
+
+def make_request(session, base, questions, n):
+    question = random.choice(questions)
+    roll = random.random()
+    if roll < 0.4:
+        return session.get(f'{base}/questions', params={'limit': 20, 'view': 'summary'})
+    if roll < 0.7:
+        return session.get(f"{base}/questions/{question['id']}")
+    if roll < 0.9 and question.get('files', {}).get('pdf'):
+        # The sample bank was created on Windows
+        return session.get(f"{base}/pdf/{question['files']['pdf'].replace(chr(92), '/')}")
+    return session.post(f'{base}/submit-attempt', json={
+        'userId': f'load{n}',
+        'questionId': question['id'],
+        'answer': 'test',
+        'timeSpent': '00:42',
+        'pointsEarned': question.get('points', 0)
+    })
+
+def run(base, questions, clients, seconds):
+    latencies = []
+    errors = [0]
+    stop = time.monotonic() + seconds
+
+    def client(n):
+        session = requests.Session()
+        local = []
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                response = make_request(session, base, questions, n)
+                response.content
+                if response.status_code >= 400:
+                    errors[0] += 1
+            except requests.RequestException:
+                errors[0] += 1
+            local.append(time.perf_counter() - start)
+        latencies.extend(local)
+
+    workers = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors[0]
+
+def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    threads = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+
+    for mode in ('dev', 'production'):
+        work_dir = tempfile.mkdtemp(prefix='hexagym_server_')
+        try:
+            questions = make_storage(work_dir)
+            port = free_port()
+            process = start_server(mode, port, work_dir, workers, threads)
+            try:
+                latencies, errors = run(f'http://127.0.0.1:{port}', questions, clients, seconds)
+            finally:
+                process.terminate()
+                process.wait(timeout=60)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        latencies.sort()
+        print(f"{mode:>10}: {len(latencies) / seconds:8.0f} req/s  "
+              f"p50={statistics.median(latencies) * 1000:.2f}ms  "
+              f"p95={latencies[int(len(latencies) * 0.95)] * 1000:.2f}ms  "
+              f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms  "
+              f"errors={errors}")
+
+if __name__ == "__main__":
+    main()
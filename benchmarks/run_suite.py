@@ -0,0 +1,290 @@
+"""Reproducible benchmark suite for the storage and compile hot paths.
+
+Usage: python benchmarks/run_suite.py [--sizes 100,10000,100000] [--output results.json]
+       python benchmarks/run_suite.py --compare old.json new.json
+
+For each bank size, writes that many synthetic questions (based on the
+generate_questions.py samples) into a throwaway storage/questions folder and
+starts the app on it in a fresh process. It then measures, through the
+Flask test client:
+
+- startup: importing app and loading the question index
+- list_all: GET /questions, list_page: GET /questions?limit=20&view=summary
+- lookup: GET /questions/<id> for random ids
+- submit: POST /submit-attempt
+- compile_cold / compile_cached: POST /compile of every sample question,
+  first with an empty compile cache and then again (skipped without pdflatex)
+- load: `--threads` clients sending a mix of the above for `--seconds`.
+  With pdflatex, 5% of it is /compile, half of that sources never seen
+  before (so pdflatex runs under the concurrent load) and half cached
+
+Every request uses a seeded RNG, so two runs with the same arguments send the
+same requests. Results are written as JSON with the machine and commit they
+ran on; --compare prints the change in median latency and throughput between
+two result files.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_storage import make_bank
+
+# Requests per single-threaded measurement; full listings of large banks get fewer
+REPEATS = {'list_all': 20, 'list_page': 200, 'lookup': 2000, 'submit': 1000}
+LIST_ALL_BUDGET = 200000  # question records returned across all list_all repeats
+
+def summarize(samples, seconds=None):
+    """Latency percentiles in milliseconds, and throughput if the wall time is given."""
+    samples = sorted(samples)
+    n = len(samples)
+    summary = {
+        'n': n,
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(samples[n // 2] * 1000, 3),
+        'p95_ms': round(samples[min(n - 1, int(n * 0.95))] * 1000, 3),
+        'p99_ms': round(samples[min(n - 1, int(n * 0.99))] * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3)
+    }
+    summary['rps'] = round(n / (seconds if seconds is not None else sum(samples)), 1)
+    return summary
+
+def timed_requests(send, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        response = send(i)
+        response.get_data()
+        samples.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise RuntimeError(f"Request failed with {response.status_code}: {response.get_data()[:200]!r}")
+    return samples
+
+def attempt(rng, question_id, user):
+    return {
+        'userId': user,
+        'questionId': question_id,
+        'answer': 'bench' if rng.random() < 0.5 else '42',
+        'timeSpent': '00:30',
+        'pointsEarned': 1
+    }
+
+# Share of the load phase that is /compile, when pdflatex is there
+LOAD_COMPILE_SHARE = 0.05
+
+def run_load(app, ids, threads, seconds, seed, sources=None):
+    """Mixed traffic from `threads` test clients; return latencies per request kind.
+
+    sources, if given, are LaTeX bodies to send to /compile as part of the mix.
+    """
+    latencies = {'list_page': [], 'lookup': [], 'submit': []}
+    if sources:
+        latencies['compile'] = []
+    compile_from = 1 - LOAD_COMPILE_SHARE if sources else 1
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def client(n):
+        rng = random.Random(seed + n)
+        c = app.app.test_client()
+        local = {kind: [] for kind in latencies}
+        while time.monotonic() < stop:
+            roll = rng.random()
+            question_id = rng.choice(ids)
+            start = time.perf_counter()
+            if roll < 0.3:
+                kind = 'list_page'
+                response = c.get('/questions', query_string={'limit': 20, 'view': 'summary'})
+            elif roll < 0.8:
+                kind = 'lookup'
+                response = c.get(f'/questions/{question_id}')
+            elif roll < compile_from:
+                kind = 'submit'
+                response = c.post('/submit-attempt', json=attempt(rng, question_id, f'load{n}'))
+            else:
+                kind = 'compile'
+                latex_code = rng.choice(sources)
+                if rng.random() < 0.5:
+                    # A comment of its own makes it miss the compile cache
+                    latex_code += f'\n% load {n} {len(local[kind])}\n'
+                response = c.post('/compile', json={'latex_code': latex_code})
+            response.get_data()
+            local[kind].append(time.perf_counter() - start)
+        with lock:
+            for kind, samples in local.items():
+                latencies[kind].extend(samples)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=client, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    result = {kind: summarize(samples, elapsed) for kind, samples in latencies.items() if samples}
+    result['total'] = summarize([s for samples in latencies.values() for s in samples], elapsed)
+    result['threads'] = threads
+    result['seconds'] = round(elapsed, 3)
+    return result
+
+def run_size(args):
+    """Benchmark the bank in the current directory; runs in its own process."""
+    with open('bench_ids.json') as f:
+        ids = json.load(f)
+    rng = random.Random(args.seed)
+
+    start = time.perf_counter()
+    import app
+    startup = time.perf_counter() - start
+    client = app.app.test_client()
+    results = {'size': len(ids), 'startup_seconds': round(startup, 3)}
+
+    list_all = max(1, min(REPEATS['list_all'], LIST_ALL_BUDGET // max(1, len(ids))))
+    results['list_all'] = summarize(timed_requests(lambda i: client.get('/questions'), list_all))
+    results['list_page'] = summarize(timed_requests(
+        lambda i: client.get('/questions', query_string={'limit': 20, 'view': 'summary'}),
+        REPEATS['list_page']))
+    lookup_ids = [rng.choice(ids) for _ in range(REPEATS['lookup'])]
+    results['lookup'] = summarize(timed_requests(
+        lambda i: client.get(f'/questions/{lookup_ids[i]}'), REPEATS['lookup']))
+    submit_ids = [rng.choice(ids) for _ in range(REPEATS['submit'])]
+    results['submit'] = summarize(timed_requests(
+        lambda i: client.post('/submit-attempt', json=attempt(rng, submit_ids[i], f'bench{i % 50}')),
+        REPEATS['submit']))
+
+    if args.compile and shutil.which('pdflatex'):
+        from generate_questions import questions
+        send = lambda i: client.post('/compile', json={'latex_code': questions[i]['content']})
+        # Fresh storage, so the first round misses the compile cache
+        results['compile_cold'] = summarize(timed_requests(send, len(questions)))
+        results['compile_cached'] = summarize(timed_requests(send, len(questions)))
+    elif args.compile:
+        results['compile_skipped'] = 'pdflatex not found'
+
+    if args.seconds > 0:
+        sources = None
+        if args.compile and shutil.which('pdflatex'):
+            from generate_questions import questions
+            sources = [question['content'] for question in questions]
+        results['load'] = run_load(app, ids, args.threads, args.seconds, args.seed, sources)
+
+    journal = app.get_attempt_journal()
+    journal.close()
+
+    with open('bench_result.json', 'w') as f:
+        json.dump(results, f)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def bench_size(size, args):
+    work_dir = tempfile.mkdtemp(prefix='hexagym_suite_')
+    try:
+        questions_dir = os.path.join(work_dir, 'storage', 'questions')
+        os.makedirs(questions_dir)
+        print(f"{size} questions: writing bank...", file=sys.stderr)
+        ids = make_bank(questions_dir, size)
+        with open(os.path.join(work_dir, 'bench_ids.json'), 'w') as f:
+            json.dump(ids, f)
+
+        print(f"{size} questions: measuring...", file=sys.stderr)
+        command = [sys.executable, os.path.abspath(__file__), '--worker',
+                   '--seed', str(args.seed), '--threads', str(args.threads), '--seconds', str(args.seconds)]
+        if not args.compile:
+            command.append('--no-compile')
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.dirname(os.path.abspath(__file__))]))
+        # The app logs to stdout; keep it out of the way
+        subprocess.run(command, cwd=work_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(os.path.join(work_dir, 'bench_result.json')) as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {run['size']: run for run in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {run['size']: run for run in json.load(f)['results']}
+
+    def change(before, after):
+        return f"{(after - before) / before * 100:+7.1f}%" if before else '    n/a'
+
+    for size in sorted(old.keys() & new.keys()):
+        print(f"\n{size} questions")
+        before, after = old[size], new[size]
+        print(f"  {'startup':<22} {before['startup_seconds']:10.3f}s -> {after['startup_seconds']:10.3f}s "
+              f"{change(before['startup_seconds'], after['startup_seconds'])}")
+        rows = [(name, before[name], after[name]) for name in before
+                if isinstance(before[name], dict) and 'p50_ms' in before[name] and name in after]
+        rows += [(f"load.{kind}", before['load'][kind], after['load'][kind])
+                 for kind in before.get('load', {}) if isinstance(before['load'][kind], dict)
+                 and kind in after.get('load', {})]
+        for name, b, a in rows:
+            print(f"  {name + ' p50':<22} {b['p50_ms']:10.3f}ms -> {a['p50_ms']:9.3f}ms {change(b['p50_ms'], a['p50_ms'])}"
+                  f"   rps {b['rps']:9.1f} -> {a['rps']:9.1f} {change(b['rps'], a['rps'])}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the HexaGym storage and compile hot paths.")
+    parser.add_argument('--sizes', default='100,10000,100000',
+                        help="comma separated question bank sizes")
+    parser.add_argument('--output', default='-', help="file for the JSON results (default: stdout)")
+    parser.add_argument('--threads', type=int, default=8, help="concurrent clients in the load phase")
+    parser.add_argument('--seconds', type=float, default=5, help="length of the load phase (0 skips it)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-compile', dest='compile', action='store_false',
+                        help="skip the /compile measurements")
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help="compare two result files instead of running")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.worker:
+        run_size(args)
+        return
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    report = {
+        'meta': {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'pdflatex': shutil.which('pdflatex') is not None,
+            'args': {'sizes': sizes, 'threads': args.threads, 'seconds': args.seconds,
+                     'seed': args.seed, 'compile': args.compile}
+        },
+        'results': [bench_size(size, args) for size in sizes]
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f"Results written to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
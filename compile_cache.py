@@ -0,0 +1,186 @@
+import os
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+def source_hash(full_latex_code):
+    """Content address of a complete LaTeX document (preamble included)."""
+    return hashlib.sha256(full_latex_code.encode('utf-8')).hexdigest()
+
+class CompileCache:
+    """Size-bounded LRU cache of compile results, stored under cache_dir.
+
+    Each entry is a folder named after the source hash holding either
+    question.pdf for a successful build or error.txt for a failed one.
+    Several server processes may share cache_dir: an entry another process
+    stored is picked up on lookup, and each process evicts by its own view
+    of the cache.
+    """
+
+    def __init__(self, cache_dir, max_bytes, max_entries=10000):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the LRU order from what is already on disk."""
+        found = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            if not os.path.isdir(entry_dir):
+                continue
+            if key.endswith('.tmp'):
+                # Left over from an interrupted put (recent ones may belong to a live process)
+                if time.time() - os.path.getmtime(entry_dir) > 600:
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+            found.append((os.path.getmtime(entry_dir), key, size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Return {'pdf_path': ...} or {'error': ...} for a cached build, else None."""
+        with self._lock:
+            if key not in self._entries and not self._adopt(key):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        entry_dir = self._entry_dir(key)
+        pdf_path = os.path.join(entry_dir, 'question.pdf')
+        error_path = os.path.join(entry_dir, 'error.txt')
+        try:
+            os.utime(entry_dir)
+            if os.path.exists(pdf_path):
+                return {'pdf_path': pdf_path}
+            with open(error_path, 'r', encoding='utf-8') as f:
+                return {'error': f.read() or None}
+        except OSError:
+            # Entry vanished underneath us, treat it as a miss
+            self._forget(key)
+            return None
+
+    def _adopt(self, key):
+        """Track an entry another process stored. Caller holds the lock."""
+        entry_dir = self._entry_dir(key)
+        try:
+            size = sum(os.path.getsize(os.path.join(entry_dir, f)) for f in os.listdir(entry_dir))
+        except OSError:
+            return False
+        self._entries[key] = size
+        self._size += size
+        self._evict()
+        return key in self._entries
+
+    def put_pdf(self, key, pdf_path):
+        """Store a copy of a successfully built PDF."""
+        self._put(key, lambda entry_dir: shutil.copyfile(pdf_path, os.path.join(entry_dir, 'question.pdf')))
+
+    def put_error(self, key, error_message):
+        """Remember that this source fails to compile, and why."""
+        def write(entry_dir):
+            with open(os.path.join(entry_dir, 'error.txt'), 'w', encoding='utf-8') as f:
+                f.write(error_message or '')
+        self._put(key, write)
+
+    def _put(self, key, write):
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            write(tmp_dir)
+            size = sum(os.path.getsize(os.path.join(tmp_dir, f)) for f in os.listdir(tmp_dir))
+            with self._lock:
+                if key in self._entries or self._adopt(key):
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    return
+                os.rename(tmp_dir, entry_dir)
+                self._entries[key] = size
+                self._size += size
+                self._evict()
+        except OSError as e:
+            print(f"Error caching compile result {key}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def _forget(self, key):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._size -= size
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def _evict(self):
+        """Drop least recently used entries until within bounds. Caller holds the lock."""
+        while self._entries and (self._size > self.max_bytes or len(self._entries) > self.max_entries):
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+class SingleFlight:
+    """Coalesce concurrent compiles of the same source into one.
+
+    The first caller for a key becomes the leader and does the work; callers
+    arriving while it runs wait for the leader's result instead of starting
+    their own pdflatex.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Return (is_leader, flight) for key."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return False, flight
+            flight = {'done': threading.Event(), 'result': None}
+            self._flights[key] = flight
+            return True, flight
+
+    def finish(self, key, result):
+        """Publish the leader's result and release everyone waiting on it."""
+        with self._lock:
+            flight = self._flights.pop(key)
+        flight['result'] = result
+        flight['done'].set()
+
+    def wait(self, flight):
+        flight['done'].wait()
+        return flight['result']
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._flights), 'coalesced': self.coalesced}
@@ -0,0 +1,165 @@
+import os
+import json
+import glob
+import time
+import uuid
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at its depth limit."""
+
+class CompileJobQueue:
+    """Bounded pool that runs compile jobs and keeps their status around.
+
+    Each worker thread spends nearly all of its time waiting on a pdflatex
+    subprocess, so the number of workers caps how many TeX processes run at
+    once. A job function returns a (payload, status_code) pair, which is what
+    the HTTP layer sends back once the job is done.
+
+    With a state_dir, every job's status is also written to
+    <state_dir>/<id>.json, so any server process can answer a status poll
+    for a job that runs in another one.
+    """
+
+    def __init__(self, workers, max_pending, keep_finished=600, state_dir=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished  # seconds a finished job stays queryable
+        self.state_dir = state_dir
+        self._files_pruned_at = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='compile')
+        self._jobs = {}
+        self._events = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) and return the new job id."""
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_pending:
+                raise QueueFull()
+            job_id = uuid.uuid4().hex[:12]
+            self._jobs[job_id] = {
+                'id': job_id,
+                'status': 'queued',
+                'created_at': datetime.now().isoformat(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'status_code': None,
+                '_finished': None
+            }
+            self._events[job_id] = threading.Event()
+            self._pending += 1
+            self._save(self._jobs[job_id])
+
+        self._executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def _run(self, job_id, fn, args):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = 'running'
+            job['started_at'] = datetime.now().isoformat()
+            self._save(job)
+
+        try:
+            payload, status_code = fn(*args)
+        except Exception as e:
+            payload, status_code = {"success": False, "error": str(e)}, 500
+
+        with self._lock:
+            job.update({
+                'status': 'done',
+                'finished_at': datetime.now().isoformat(),
+                'result': payload,
+                'status_code': status_code,
+                '_finished': time.monotonic()
+            })
+            self._pending -= 1
+            event = self._events.pop(job_id)
+            self._save(job)
+        event.set()
+
+    def _save(self, job):
+        """Publish the job's status for other processes. Caller holds the lock."""
+        if not self.state_dir:
+            return
+        path = os.path.join(self.state_dir, f"{job['id']}.json")
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump({k: v for k, v in job.items() if not k.startswith('_')}, f)
+            os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error saving compile job {job['id']}: {e}")
+
+    def _load(self, job_id):
+        """Status of a job owned by another process, from its state file."""
+        if not self.state_dir or not job_id.isalnum():
+            return None
+        try:
+            with open(os.path.join(self.state_dir, f"{job_id}.json"), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return self._load(job_id)
+            snapshot = {k: v for k, v in job.items() if not k.startswith('_')}
+            if job['status'] == 'queued':
+                snapshot['queue_position'] = sum(
+                    1 for other in self._jobs.values()
+                    if other['status'] == 'queued' and other['created_at'] <= job['created_at']
+                )
+            return snapshot
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job is done and return its snapshot."""
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+        return self.get(job_id)
+
+    def run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for its (payload, status_code)."""
+        job = self.wait(self.submit(fn, *args))
+        return job['result'], job['status_code']
+
+    def _prune(self):
+        """Forget finished jobs older than keep_finished. Caller holds the lock."""
+        cutoff = time.monotonic() - self.keep_finished
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['_finished'] is not None and job['_finished'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+        # State files are shared by every process; sweep them now and then
+        if self.state_dir and time.monotonic() - self._files_pruned_at > 60:
+            self._files_pruned_at = time.monotonic()
+            cutoff = time.time() - self.keep_finished
+            for path in glob.glob(os.path.join(self.state_dir, '*.json')):
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job['status'] == 'running')
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'queued': self._pending - running,
+                'running': running
+            }
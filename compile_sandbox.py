@@ -0,0 +1,233 @@
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+
+try:
+    import resource
+except ImportError:
+    # Windows: only the wall-clock limit is enforced
+    resource = None
+
+# Why a sandboxed run was stopped, reported as the compile's error_code
+LIMIT_TIMEOUT = 'timeout'
+LIMIT_CPU = 'cpu_limit'
+LIMIT_OUTPUT = 'output_limit'
+# Killed by a signal from outside (the OOM killer, say): not the source's fault for sure, not to be cached
+LIMIT_KILLED = 'killed'
+
+# Limits are set on the started process where the platform can (Linux);
+# elsewhere they are set in the child before exec
+PRLIMIT = resource is not None and hasattr(resource, 'prlimit')
+
+# stdout kept per run; pdflatex writes everything that matters to its .log
+MAX_CAPTURED_OUTPUT = 256 * 1024
+
+def sandbox_limits(wall_seconds, cpu_seconds, memory_mb, output_mb):
+    """Limits for run_sandboxed; 0 disables a limit."""
+    return {
+        'wall_seconds': wall_seconds,
+        'cpu_seconds': cpu_seconds,
+        'memory_bytes': memory_mb * 1024 * 1024,
+        'output_bytes': output_mb * 1024 * 1024
+    }
+
+def _rlimits(limits):
+    """(resource, (soft, hard)) pairs for the limits that are set."""
+    rlimits = []
+    if limits['cpu_seconds']:
+        # SIGXCPU at the soft limit, SIGKILL a second later if it's ignored
+        rlimits.append((resource.RLIMIT_CPU, (limits['cpu_seconds'], limits['cpu_seconds'] + 1)))
+    if limits['memory_bytes']:
+        rlimits.append((resource.RLIMIT_AS, (limits['memory_bytes'], limits['memory_bytes'])))
+    if limits['output_bytes']:
+        # Caps the size of every file the process writes
+        rlimits.append((resource.RLIMIT_FSIZE, (limits['output_bytes'], limits['output_bytes'])))
+    return rlimits
+
+def _set_rlimits(limits):
+    """Runs in the child between fork and exec, where prlimit isn't available (macOS)."""
+    for limit, values in _rlimits(limits):
+        resource.setrlimit(limit, values)
+
+def _apply_rlimits(pid, limits):
+    """Set the limits on a started process (Linux).
+
+    CPU time counts from the start either way; the process runs without a
+    memory and file size limit only until this returns.
+    """
+    for limit, values in _rlimits(limits):
+        try:
+            resource.prlimit(pid, limit, values)
+        except ProcessLookupError:
+            # Already gone; wait() reports how it ended
+            return
+
+def run_sandboxed(command, limits, cwd=None, on_line=None):
+    """Run command under limits, killing its whole process group on timeout.
+
+    Returns a subprocess.CompletedProcess (stdout as text, stderr folded
+    into stdout) with two extra attributes: limit_error, one of the LIMIT_*
+    codes or None, and usage, {'cpu_seconds', 'max_rss_kb', 'wall_seconds'}
+    (max_rss_kb is None where the platform can't tell). on_line, if given,
+    is called with each line of output as the process writes it.
+    """
+    if resource is None:
+        return _run_with_timeout(command, limits, cwd, on_line)
+
+    process = SandboxedProcess(command, limits, cwd, on_line)
+    process.start_clock()
+    return process.wait()
+
+class SandboxedProcess:
+    """A process started under limits whose wall-clock limit runs from start_clock().
+
+    run_sandboxed starts the clock right away; a process that is started
+    ahead of time and then waits for work (see tex_pool) starts it when
+    the work arrives, and its usage then only counts from that point on.
+    Not available on Windows.
+    """
+
+    def __init__(self, command, limits, cwd=None, on_line=None):
+        self.command = command
+        self.limits = limits
+        self.on_line = on_line
+        self.process = subprocess.Popen(
+            command,
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,  # own process group, so a kill takes its children too
+            # Without a preexec_fn Popen can use vfork/posix_spawn, and nothing
+            # runs in the child between fork and exec while other threads hold locks
+            preexec_fn=None if PRLIMIT else lambda: _set_rlimits(limits)
+        )
+        self.pid = self.process.pid
+        if PRLIMIT:
+            _apply_rlimits(self.pid, limits)
+        self._output = []
+        self._started = None
+        self._cpu_before = 0.0
+        self._timer = None
+        self._timed_out = threading.Event()
+        self._reaped = threading.Lock()
+        self._reader = threading.Thread(target=self._read_output, daemon=True)
+        self._reader.start()
+
+    def _read_output(self):
+        kept = 0
+        for chunk in iter(lambda: self.process.stdout.readline(65536), b''):
+            if kept < MAX_CAPTURED_OUTPUT:
+                self._output.append(chunk[:MAX_CAPTURED_OUTPUT - kept])
+                kept += len(self._output[-1])
+            on_line = self.on_line
+            if on_line is not None:
+                try:
+                    on_line(chunk.decode('utf-8', errors='replace'))
+                except Exception as e:
+                    print(f"Error handling output of {self.command[0]}: {e}")
+        self.process.stdout.close()
+
+    def start_clock(self):
+        """Arm the wall-clock limit and start counting usage."""
+        self._started = time.monotonic()
+        self._cpu_before = _cpu_seconds(self.pid)
+        if self.limits['wall_seconds']:
+            self._timer = threading.Timer(self.limits['wall_seconds'], self._kill_on_timeout)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def alive(self):
+        # WNOWAIT leaves an exited process for wait() to reap, with its usage
+        try:
+            return os.waitid(os.P_PID, self.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None
+        except ChildProcessError:
+            return False
+
+    def _kill_on_timeout(self):
+        with self._reaped:
+            if self.process.returncode is None:
+                self._timed_out.set()
+                self.kill()
+
+    def kill(self):
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def wait(self):
+        """Wait for the process to exit; return it as run_sandboxed does."""
+        # wait4 rather than wait() to get this child's own resource usage
+        _, status, rusage = os.wait4(self.pid, 0)
+        with self._reaped:
+            self.process.returncode = os.waitstatus_to_exitcode(status)
+        if self._timer:
+            self._timer.cancel()
+        # Anything it left running in the background would keep the output pipe open
+        self.kill()
+        self._reader.join()
+
+        max_rss = rusage.ru_maxrss
+        if sys.platform == 'darwin':
+            max_rss //= 1024  # bytes there, kilobytes on Linux
+        started = self._started if self._started is not None else time.monotonic()
+        usage = {
+            'cpu_seconds': round(max(0.0, rusage.ru_utime + rusage.ru_stime - self._cpu_before), 3),
+            'max_rss_kb': max_rss,
+            'wall_seconds': round(time.monotonic() - started, 3)
+        }
+
+        returncode = self.process.returncode
+        limit_error = None
+        if self._timed_out.is_set():
+            limit_error = LIMIT_TIMEOUT
+        elif returncode == -signal.SIGXCPU or (
+                returncode == -signal.SIGKILL and self.limits['cpu_seconds']
+                and rusage.ru_utime + rusage.ru_stime >= self.limits['cpu_seconds']):
+            limit_error = LIMIT_CPU
+        elif returncode == -signal.SIGXFSZ:
+            limit_error = LIMIT_OUTPUT
+        elif returncode < 0:
+            limit_error = LIMIT_KILLED
+
+        result = subprocess.CompletedProcess(
+            self.command, returncode, b''.join(self._output).decode('utf-8', errors='replace'), None
+        )
+        result.limit_error = limit_error
+        result.usage = usage
+        return result
+
+def _cpu_seconds(pid):
+    """CPU time a running process has used so far (Linux only, else 0)."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Fields after the parenthesized command name; utime and stime are 14 and 15
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+def _run_with_timeout(command, limits, cwd, on_line=None):
+    started = time.monotonic()
+    limit_error = None
+    try:
+        result = subprocess.run(command, cwd=cwd, capture_output=True, text=True,
+                                timeout=limits['wall_seconds'] or None)
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout or b''
+        result = subprocess.CompletedProcess(
+            command, -1, output.decode('utf-8', errors='replace') if isinstance(output, bytes) else output, None
+        )
+        limit_error = LIMIT_TIMEOUT
+    if on_line is not None:
+        # No reader thread here: the lines arrive all at once at the end
+        for line in (result.stdout or '').splitlines(True):
+            on_line(line)
+    result.limit_error = limit_error
+    result.usage = {'cpu_seconds': None, 'max_rss_kb': None,
+                    'wall_seconds': round(time.monotonic() - started, 3)}
+    return result
@@ -0,0 +1,185 @@
+import os
+import re
+import glob
+import shutil
+import tempfile
+import threading
+from compile_cache import CompileCache, SingleFlight, source_hash
+from compile_sandbox import run_sandboxed
+from metrics import time_stage
+
+# Environments compiled on their own; each match runs to the first \end of the same name
+FIGURE_PATTERN = re.compile(r'\\begin\{(tikzpicture|circuitikz)\}.*?\\end\{\1\}', re.DOTALL)
+DOCUMENTCLASS_PATTERN = re.compile(r'\\documentclass(?:\[([^\]]*)\])?\{[^}]*\}')
+
+# Figures that depend on the page around them (its width, other pictures,
+# labels, their own baseline) would not come out the same on their own
+PAGE_DEPENDENT = ('textwidth', 'linewidth', 'columnwidth', '\\hsize', 'remember picture',
+                  'overlay', 'baseline', '\\label', '\\ref', '\\pageref')
+
+# Commands in the body that change how what follows them typesets (keys,
+# colors, macros, lengths, fonts); a figure after one would not come out
+# the same on its own
+BODY_STATE_PATTERN = re.compile(
+    r'\\(?:tikzset|pgfplotsset|ctikzset|pgfkeys|usetikzlibrary|color|definecolor|colorlet|'
+    r'newcommand|renewcommand|providecommand|newenvironment|renewenvironment|def|edef|gdef|xdef|let|'
+    r'setlength|addtolength|fontsize|selectfont|tiny|scriptsize|footnotesize|small|normalsize|'
+    r'large|Large|LARGE|huge|Huge|bfseries|itshape|sffamily|ttfamily|rmfamily)(?![a-zA-Z])')
+
+# Copies of the figures a document includes sit next to it under this prefix
+FIGURE_FILE_PREFIX = 'fig-'
+
+class FigureCache:
+    """Compiled tikzpicture and circuitikz figures, shared by every compile.
+
+    externalize() takes each figure out of a question's LaTeX, compiles it
+    once into a standalone PDF keyed by the hash of its source and puts an
+    \\includegraphics of that PDF in its place, so editing the text around
+    a figure doesn't render the figure again. The PDFs live in a size-bounded
+    CompileCache. Figures after a change of state in the body (a \\tikzset,
+    a \\color, a new macro, a font size) stay inline, and so does a figure
+    that can't be compiled on its own.
+    """
+
+    def __init__(self, cache_dir, max_bytes, preamble, limits):
+        self.store = CompileCache(cache_dir, max_bytes)
+        self.limits = limits
+        self.header = figure_header(preamble)
+        self.compiled = 0
+        self.inline = 0
+        self._flights = SingleFlight()
+        self._lock = threading.Lock()
+
+    def externalize(self, latex_code, folder_path, on_run=None):
+        """Return latex_code with its figures replaced by cached PDFs copied into folder_path.
+
+        The replacement keeps the line count of every figure, so TeX's line
+        numbers for the rest of the document don't change. on_run, if given,
+        is called with the result of run_sandboxed for each figure compiled,
+        so the caller can count its usage and limits as the document's own.
+        """
+        figures = list(FIGURE_PATTERN.finditer(latex_code))
+        state_changed_at = first_state_change(latex_code, [(m.start(), m.end()) for m in figures])
+        used = set()
+        parts = []
+        end = 0
+        for match in figures:
+            source = match.group(0)
+            if is_commented(latex_code, match.start()) or any(token in source for token in PAGE_DEPENDENT):
+                continue
+            if state_changed_at is not None and state_changed_at < match.start():
+                continue
+            document = self.header + source + '\n\\end{document}\n'
+            key = source_hash(document)
+            name = f"{FIGURE_FILE_PREFIX}{key[:16]}.pdf"
+            target = os.path.join(folder_path, name)
+            if name not in used and not self._place(key, document, target, on_run):
+                continue
+
+            used.add(name)
+            graphic = os.path.abspath(target).replace(os.sep, '/')
+            parts.append(latex_code[end:match.start()])
+            parts.append('%\n' * source.count('\n') + '\\includegraphics{' + graphic + '}')
+            end = match.end()
+        parts.append(latex_code[end:])
+
+        # Figures of an earlier version of the question
+        for old in glob.glob(os.path.join(folder_path, FIGURE_FILE_PREFIX + '*.pdf')):
+            if os.path.basename(old) not in used:
+                os.unlink(old)
+        return ''.join(parts)
+
+    def _place(self, key, document, target, on_run=None):
+        """Copy the figure's PDF to target, compiling it first if needed.
+
+        Returns False if the figure doesn't compile on its own.
+        """
+        cached = self.store.get(key)
+        if cached and 'error' in cached:
+            return False
+        if cached and self._copy(cached['pdf_path'], target):
+            return True
+
+        # Every compile that has this figure and misses the cache waits for one build
+        is_leader, flight = self._flights.begin(key)
+        if not is_leader:
+            if not self._flights.wait(flight):
+                return False
+            cached = self.store.get(key)
+            return bool(cached and 'pdf_path' in cached and self._copy(cached['pdf_path'], target))
+
+        built = False
+        try:
+            with time_stage('figure_compile'):
+                built = self._compile(key, document, target, on_run)
+        finally:
+            self._flights.finish(key, built)
+        with self._lock:
+            if built:
+                self.compiled += 1
+            else:
+                self.inline += 1
+        return built
+
+    def _copy(self, pdf_path, target):
+        try:
+            shutil.copyfile(pdf_path, target)
+            return True
+        except OSError:
+            # Evicted between lookup and copy
+            return False
+
+    def _compile(self, key, document, target, on_run=None):
+        # The .tmp suffix has CompileCache clean up builds a crash left behind
+        build_dir = tempfile.mkdtemp(prefix='build-', suffix='.tmp', dir=self.store.cache_dir)
+        try:
+            tex_path = os.path.join(build_dir, 'figure.tex')
+            with open(tex_path, 'w', encoding='utf-8') as f:
+                f.write(document)
+            process = run_sandboxed(
+                ['pdflatex', '-interaction=nonstopmode', '-output-directory', build_dir, tex_path],
+                self.limits
+            )
+            if on_run is not None:
+                on_run(process)
+            built_path = os.path.join(build_dir, 'figure.pdf')
+            if process.returncode != 0 or not os.path.exists(built_path):
+                if process.limit_error is None:
+                    # Remembered, so the figure isn't tried on its own again
+                    self.store.put_error(key, process.stdout[-500:])
+                return False
+            shutil.copyfile(built_path, target)
+            self.store.put_pdf(key, built_path)
+            return True
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            counts = {'compiled': self.compiled, 'inline': self.inline}
+        return {**self.store.stats(), **counts}
+
+def figure_header(preamble):
+    """The question preamble as a standalone document cropped to its content."""
+    header = preamble[:preamble.find('\\begin{document}')]
+    match = DOCUMENTCLASS_PATTERN.search(header)
+    options = [option for option in (match.group(1) or '').split(',') if option.strip()]
+    header = (header[:match.start()] + '\\documentclass[' + ','.join(options + ['border=0pt']) +
+              ']{standalone}' + header[match.end():])
+    # The page size is the figure's own here
+    header = '\n'.join(line for line in header.split('\n') if 'geometry' not in line)
+    return header + '\n\\begin{document}\n'
+
+def first_state_change(text, skip):
+    """Position of the first uncommented BODY_STATE_PATTERN command outside the skip spans, or None."""
+    for match in BODY_STATE_PATTERN.finditer(text):
+        position = match.start()
+        if any(start <= position < end for start, end in skip) or is_commented(text, position):
+            continue
+        return position
+    return None
+
+def is_commented(text, position):
+    """Whether position is on a line after an unescaped %."""
+    line = text[text.rfind('\n', 0, position) + 1:position]
+    return re.search(r'(?<!\\)%', line) is not None
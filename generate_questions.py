@@ -1,4 +1,6 @@
+import sys
 import json
+import argparse
 import requests
 
 # Sample questions with carefully crafted content
@@ -353,9 +355,9 @@ b) How does field strength vary with distance?
     }
 ]
 
-def post_question(question):
+def post_question(question, url):
     try:
-        response = requests.post('http://localhost:5000/questions', json=question)
+        response = requests.post(f'{url}/questions', json=question)
         if response.status_code == 200:
             print(f"Successfully added question: {question['name']}")
         else:
@@ -364,11 +366,66 @@ def post_question(question):
     except Exception as e:
         print(f"Error posting question: {str(e)}")
 
+def read_questions(path):
+    """Questions from a JSON array or JSON Lines file ('-' reads stdin)."""
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        text = f.read()
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def bulk_import(questions, url):
+    """Send every question to /questions/bulk and print results as they stream back."""
+    body = ''.join(json.dumps(question) + '\n' for question in questions)
+    try:
+        response = requests.post(
+            f'{url}/questions/bulk',
+            data=body.encode('utf-8'),
+            headers={'Content-Type': 'application/x-ndjson'},
+            stream=True
+        )
+    except Exception as e:
+        print(f"Error posting questions: {str(e)}")
+        return
+    if response.status_code != 200:
+        print(f"Bulk import failed: {response.text}")
+        return
+
+    for line in response.iter_lines():
+        if not line:
+            continue
+        result = json.loads(line)
+        if result.get('done'):
+            print(f"Imported {result['imported']} questions, {result['failed']} failed.")
+        elif result['success']:
+            print(f"Successfully added question: {questions[result['index']]['name']}")
+        else:
+            question = questions[result['index']]
+            name = question.get('name') if isinstance(question, dict) else None
+            print(f"Failed to add question: {name or '#' + str(result['index'])}")
+            print(f"Error: {result['error']}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Seed the question bank.")
+    parser.add_argument('--url', default='http://localhost:5000', help="server to post to")
+    parser.add_argument('--bulk', action='store_true',
+                        help="send all questions in one request to /questions/bulk")
+    parser.add_argument('--file', help="JSON array or JSON Lines file of questions ('-' for stdin) "
+                                       "instead of the built-in samples")
+    args = parser.parse_args()
+
+    bank = read_questions(args.file) if args.file else questions
     print("Starting to generate questions...")
-    for question in questions:
-        post_question(question)
+    if args.bulk:
+        bulk_import(bank, args.url)
+    else:
+        for question in bank:
+            post_question(question, args.url)
     print("Finished generating questions.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
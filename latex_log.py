@@ -0,0 +1,75 @@
+import re
+
+# pdflatex prints "[<n>" as it ships out page n (followed by font map
+# names and "]"); only the next page number is taken, so "[12pt]"-like
+# text elsewhere in the output can't be mistaken for progress
+PAGE_PATTERN = re.compile(r'\[(\d+)(?=[\]\s{<]|$)')
+CONTEXT_LINE_PATTERN = re.compile(r'^l\.(\d+)')
+# Lines of an error block kept after its "! ..." line
+MAX_ERROR_LINES = 8
+
+class LatexOutputParser:
+    """Incremental reader of pdflatex's terminal output.
+
+    feed() takes the output line by line while pdflatex runs and returns
+    the events it completes: ('page', {'page': n}) when a page is shipped
+    out, and ('error', {...}) once for the first error, with its message,
+    source line number and context lines.
+    """
+
+    def __init__(self):
+        self.pages = 0
+        self.first_error = None
+        self._error_lines = None
+
+    def feed(self, line):
+        line = line.rstrip('\r\n')
+        events = []
+
+        if self._error_lines is not None:
+            # Everything up to the blank line (or the line after "l.<n> ...") is context
+            if line == '' or len(self._error_lines) > MAX_ERROR_LINES:
+                events.append(self._finish_error())
+            else:
+                self._error_lines.append(line)
+                if len(self._error_lines) > 1 and CONTEXT_LINE_PATTERN.match(self._error_lines[-2]):
+                    events.append(self._finish_error())
+            return events
+
+        if line.startswith('! ') and self.first_error is None:
+            self._error_lines = [line]
+            return events
+
+        for match in PAGE_PATTERN.finditer(line):
+            if int(match.group(1)) == self.pages + 1:
+                self.pages += 1
+                events.append(('page', {'page': self.pages}))
+        return events
+
+    def close(self):
+        """Events still pending when the output ends."""
+        if self._error_lines is not None:
+            return [self._finish_error()]
+        return []
+
+    def _finish_error(self):
+        lines = self._error_lines
+        self._error_lines = None
+        source_line = None
+        for line in lines[1:]:
+            match = CONTEXT_LINE_PATTERN.match(line)
+            if match:
+                source_line = int(match.group(1))
+                break
+        self.first_error = {
+            'message': lines[0][2:],
+            'line': source_line,
+            'context': lines[1:]
+        }
+        return ('error', self.first_error)
+
+    def error_message(self):
+        """The first error as "! message" plus its context, like the log shows it."""
+        if self.first_error is None:
+            return None
+        return '\n'.join(['! ' + self.first_error['message']] + self.first_error['context']).rstrip()
@@ -0,0 +1,151 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from a quick index lookup to a slow TikZ compile
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Registry:
+    """The metrics of this process, rendered in Prometheus' text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        # Sums of many small floats pick up noise in the last digits
+        value = round(value, 6)
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+class Counter:
+    """A monotonically increasing count per combination of label values."""
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in values]
+
+class Histogram:
+    """Observations counted into cumulative buckets, with their sum and count."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the with-block takes, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = []
+        for key, values in series:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += values[i]
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, inf)} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {values[-1]}")
+        return lines
+
+class Collected:
+    """A metric read from elsewhere (queue depth, cache counters) when scraped.
+
+    fn returns a number, or a dict of label value tuples to numbers.
+    """
+
+    def __init__(self, name, help, kind, fn, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.fn = fn
+        registry.register(self)
+
+    def samples(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+# Time spent in each step of serving a request, below the level of a route:
+# scanning the question folders, parsing metadata, each pdflatex pass, ...
+STAGE_SECONDS = Histogram('hexagym_stage_seconds', "Time spent in each stage of request handling.",
+                          labels=('stage',))
+
+def time_stage(stage):
+    return STAGE_SECONDS.time(stage=stage)
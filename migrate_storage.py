@@ -0,0 +1,48 @@
+import os
+import sys
+import json
+import argparse
+from question_store import SqliteQuestionStore
+
+def migrate(questions_dir, db_path):
+    """Import every <questions_dir>/*/metadata.json into the SQLite store."""
+    store = SqliteQuestionStore(db_path, questions_dir)
+    imported = 0
+    skipped = 0
+
+    for folder in sorted(os.listdir(questions_dir)):
+        folder_path = os.path.join(questions_dir, folder)
+        metadata_path = os.path.join(folder_path, 'metadata.json')
+        if not os.path.exists(metadata_path):
+            print(f"Skipping {folder}: no metadata.json")
+            skipped += 1
+            continue
+
+        try:
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+            store.save(folder_path, metadata)
+            imported += 1
+        except Exception as e:
+            print(f"Error importing {folder}: {e}")
+            skipped += 1
+
+    return imported, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description="Import question metadata.json files into SQLite")
+    parser.add_argument('--questions-dir', default=os.path.join('storage', 'questions'))
+    parser.add_argument('--db', default=os.path.join('storage', 'questions.db'))
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.questions_dir):
+        print(f"No questions directory at {args.questions_dir}")
+        sys.exit(1)
+
+    print(f"Migrating {args.questions_dir} into {args.db}...")
+    imported, skipped = migrate(args.questions_dir, args.db)
+    print(f"Imported {imported} questions, skipped {skipped}.")
+    print("Start the server with HEXAGYM_STORAGE=sqlite to use it.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import glob
+import shutil
+import threading
+from compile_sandbox import run_sandboxed, sandbox_limits
+
+try:
+    from PIL import Image
+except ImportError:
+    # Without Pillow only PNG previews are made
+    Image = None
+
+# Width in pixels of each render of a question's first page
+PREVIEW_SIZES = {'thumb': 320, 'page': 1240}
+
+# pdftoppm gets the same kind of limits as pdflatex: seconds, CPU seconds, MB of memory and of output
+PREVIEW_LIMITS = sandbox_limits(60, 30, 1024, 50)
+
+def preview_formats():
+    """Image formats previews are written in, preferred first."""
+    return ('webp', 'png') if Image is not None else ('png',)
+
+def preview_path(folder_path, size, pdf_hash, fmt):
+    """Renders are named after the PDF's hash, so a changed PDF never reuses a stale one."""
+    return os.path.join(folder_path, f"{size}_{pdf_hash[:16]}.{fmt}")
+
+def has_previews(folder_path, pdf_hash):
+    return all(os.path.exists(preview_path(folder_path, size, pdf_hash, fmt))
+               for size in PREVIEW_SIZES for fmt in preview_formats())
+
+def render_previews(pdf_path, folder_path, pdf_hash):
+    """Render the first page of pdf_path at every preview size.
+
+    Does nothing if renders for this pdf_hash already exist, and removes
+    renders of older versions. Returns whether the previews are available;
+    False if pdftoppm is missing or failed.
+    """
+    if has_previews(folder_path, pdf_hash):
+        return True
+    if shutil.which('pdftoppm') is None:
+        return False
+
+    # Render under a private name and move into place, so concurrent renders never clash
+    tmp_prefix = os.path.join(folder_path, f".preview-{os.getpid()}-{threading.get_ident()}")
+    try:
+        for size, width in PREVIEW_SIZES.items():
+            process = run_sandboxed(
+                ['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+                 '-scale-to-x', str(width), '-scale-to-y', '-1', pdf_path, tmp_prefix],
+                PREVIEW_LIMITS
+            )
+            if process.returncode != 0 or not os.path.exists(tmp_prefix + '.png'):
+                print(f"Rendering preview of {pdf_path} failed: {process.limit_error or process.stdout[-500:]}")
+                return False
+
+            if Image is not None:
+                with Image.open(tmp_prefix + '.png') as image:
+                    image.save(tmp_prefix + '.webp', 'WEBP', quality=80)
+                os.replace(tmp_prefix + '.webp', preview_path(folder_path, size, pdf_hash, 'webp'))
+            os.replace(tmp_prefix + '.png', preview_path(folder_path, size, pdf_hash, 'png'))
+    except OSError as e:
+        print(f"Rendering preview of {pdf_path} failed: {e}")
+        return False
+    finally:
+        for leftover in glob.glob(tmp_prefix + '.*'):
+            os.unlink(leftover)
+
+    remove_stale_previews(folder_path, pdf_hash)
+    return True
+
+def remove_stale_previews(folder_path, pdf_hash):
+    current = pdf_hash[:16]
+    for size in PREVIEW_SIZES:
+        for path in glob.glob(os.path.join(folder_path, f"{size}_*.*")):
+            if os.path.basename(path)[len(size) + 1:].split('.')[0] != current:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import bisect
+import threading
+from search_index import InvertedIndex, question_fields
+from metrics import time_stage
+
+# Sort orders accepted by query(), mapped to the key each question sorts by
+SORT_KEYS = {
+    'created_at': lambda metadata: metadata.get('created_at') or '',
+    'name': lambda metadata: (metadata.get('name') or '').lower(),
+    'points': lambda metadata: points_value(metadata),
+    # Slowest questions to build, from the usage recorded at their last compile
+    'compile_time': lambda metadata: float((metadata.get('compile') or {}).get('wall_seconds') or 0)
+}
+
+def points_value(metadata):
+    """Points as a number, for range filters and sorting."""
+    try:
+        return float(metadata.get('points') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+class QuestionIndex:
+    """Process-wide map from question id to its folder and parsed metadata.
+
+    Loaded once from questions_dir and kept in sync by the endpoints that
+    write questions. Edits made outside the app (another worker process, a
+    copied folder, a hand-edited metadata.json) are picked up from directory
+    and file mtimes, checked at most every refresh_interval seconds.
+    """
+
+    def __init__(self, questions_dir, refresh_interval=2.0):
+        self.questions_dir = questions_dir
+        self.refresh_interval = refresh_interval
+        self._entries = {}  # id -> {'folder': ..., 'metadata': ..., 'mtime': ...}
+        self._filters = None  # tag and points indexes, built on first query
+        self._search = None  # full-text index, built on first search
+        self._dir_mtime = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self._lock = threading.RLock()
+        self.refresh(force=True)
+
+    @staticmethod
+    def id_from_folder(folder):
+        """Folders are named <sanitized name>_<id>."""
+        return folder.rsplit('_', 1)[-1]
+
+    def _metadata_path(self, folder):
+        return os.path.join(self.questions_dir, folder, 'metadata.json')
+
+    def _read(self, folder):
+        """Parse a folder's metadata.json, return (metadata, mtime) or (None, None)."""
+        path = self._metadata_path(folder)
+        try:
+            mtime = os.path.getmtime(path)
+            with time_stage('metadata_parse'), open(path, 'r') as f:
+                return json.load(f), mtime
+        except (OSError, ValueError):
+            return None, None
+
+    def refresh(self, force=False):
+        """Pick up folders and metadata changed on disk since the last check.
+
+        The disk is read without holding the lock, so get() and queries go
+        on with what the index has meanwhile; only the questions that
+        changed are then swapped into it and its derived indexes.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and (self._refreshing or now - self._checked_at < self.refresh_interval):
+                return
+            self._checked_at = now
+            self._refreshing = True
+            # What the index had when the scan started: folder -> metadata mtime
+            known = {entry['folder']: entry['mtime'] for entry in self._entries.values()}
+            known_dir_mtime = self._dir_mtime
+
+        try:
+            dir_mtime, folders, changed = self._scan(known, known_dir_mtime, force)
+            with self._lock:
+                self._dir_mtime = dir_mtime
+                for folder in set(known) - set(folders):
+                    self._replace(folder, known[folder], None, None)
+                for folder, (metadata, mtime) in changed.items():
+                    self._replace(folder, known.get(folder), metadata, mtime, exists=True)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _scan(self, known, known_dir_mtime, force):
+        """(dir mtime, folders, {folder: (metadata, mtime)} of new or changed ones)."""
+        if not os.path.isdir(self.questions_dir):
+            return None, [], {}
+
+        # The folder list is only read again when folders were added or removed
+        dir_mtime = os.path.getmtime(self.questions_dir)
+        if force or dir_mtime != known_dir_mtime:
+            with time_stage('index_scan'):
+                folders = os.listdir(self.questions_dir)
+        else:
+            folders = list(known)
+
+        # Reparse any metadata.json that is new or changed in place
+        changed = {}
+        with time_stage('index_revalidate'):
+            for folder in folders:
+                try:
+                    mtime = os.path.getmtime(self._metadata_path(folder))
+                except OSError:
+                    mtime = None
+                if folder not in known or mtime != known[folder]:
+                    changed[folder] = self._read(folder) if mtime is not None else (None, None)
+        return dir_mtime, folders, changed
+
+    def _replace(self, folder, seen_mtime, metadata, mtime, exists=False):
+        """Swap in what a scan read for folder, unless the entry changed since the scan saw it."""
+        question_id = self.id_from_folder(folder)
+        entry = self._entries.get(question_id)
+        if entry is not None and (entry['folder'] != folder or entry['mtime'] != seen_mtime):
+            # put() got there first, or another folder has this id
+            return
+        if entry is None and seen_mtime is not None:
+            # remove()d since the scan started
+            return
+        self._reindex(question_id, entry['metadata'] if entry else None, metadata)
+        if exists:
+            self._entries[question_id] = {'folder': folder, 'metadata': metadata, 'mtime': mtime}
+        else:
+            self._entries.pop(question_id, None)
+
+    def _revalidate(self, entry):
+        try:
+            mtime = os.path.getmtime(self._metadata_path(entry['folder']))
+        except OSError:
+            mtime = None
+        if mtime != entry['mtime']:
+            old = entry['metadata']
+            entry['metadata'], entry['mtime'] = self._read(entry['folder'])
+            self._reindex(self.id_from_folder(entry['folder']), old, entry['metadata'])
+
+    def _reindex(self, question_id, old, new):
+        """Move a question in the derived indexes from old metadata to new (either may be None)."""
+        if self._filters is not None:
+            if old is not None:
+                self._unindex(question_id, old)
+            if new is not None:
+                self._index(question_id, new)
+        if self._search is not None:
+            if new is not None:
+                self._search.add(question_id, question_fields(new))
+            else:
+                self._search.remove(question_id)
+
+    def get(self, question_id):
+        """Return {'folder_path': ..., 'metadata': ...} or None.
+
+        The metadata dict is shared with the index and must not be mutated.
+        """
+        self.refresh()
+        with self._lock:
+            entry = self._entries.get(question_id)
+            if entry is None:
+                return None
+            self._revalidate(entry)
+            if entry['metadata'] is None:
+                return None
+            return {
+                'folder_path': os.path.join(self.questions_dir, entry['folder']),
+                'metadata': entry['metadata']
+            }
+
+    def all(self):
+        """Metadata of every question with a readable metadata.json."""
+        self.refresh()
+        with self._lock:
+            return [entry['metadata'] for entry in self._entries.values() if entry['metadata'] is not None]
+
+    def entries(self):
+        """(folder_path, metadata) of every question with a readable metadata.json."""
+        self.refresh()
+        with self._lock:
+            entries = [(os.path.join(self.questions_dir, entry['folder']), entry['metadata'])
+                       for entry in self._entries.values() if entry['metadata'] is not None]
+        return iter(entries)
+
+    def put(self, folder_path, metadata):
+        """Record metadata just written to folder_path/metadata.json."""
+        folder = os.path.basename(folder_path)
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self._metadata_path(folder))
+            except OSError:
+                mtime = None
+            question_id = self.id_from_folder(folder)
+            old = self._entries.get(question_id)
+            self._reindex(question_id, old['metadata'] if old else None, metadata)
+            self._entries[question_id] = {'folder': folder, 'metadata': metadata, 'mtime': mtime}
+
+    def remove(self, question_id):
+        with self._lock:
+            old = self._entries.pop(question_id, None)
+            if old is not None:
+                self._reindex(question_id, old['metadata'], None)
+
+    def _index(self, question_id, metadata):
+        for tag in metadata.get('tags', []):
+            key = (tag.get('type'), str(tag.get('value', '')).lower())
+            self._filters['tags'].setdefault(key, set()).add(question_id)
+        bisect.insort(self._filters['points'], (points_value(metadata), question_id))
+
+    def _unindex(self, question_id, metadata):
+        for tag in metadata.get('tags', []):
+            key = (tag.get('type'), str(tag.get('value', '')).lower())
+            self._filters['tags'].get(key, set()).discard(question_id)
+        points = self._filters['points']
+        i = bisect.bisect_left(points, (points_value(metadata), question_id))
+        if i < len(points) and points[i][1] == question_id:
+            del points[i]
+
+    def _build_filters(self):
+        """Index every question by (tag type, lowercased value) and by points."""
+        self._filters = {'tags': {}, 'points': []}
+        for question_id, entry in self._entries.items():
+            if entry['metadata'] is not None:
+                self._index(question_id, entry['metadata'])
+
+    def query(self, tags=None, min_points=None, max_points=None,
+              sort='created_at', descending=False, after=None, limit=None):
+        """Filter, sort and page through questions.
+
+        tags maps a tag type to accepted lowercase values: a question must
+        match one value of every type given. after is the (sort value, id)
+        of the last question on the previous page. Returns
+        (questions, total matching, (sort value, id) to continue from or None).
+        """
+        self.refresh()
+        with self._lock:
+            if self._filters is None:
+                self._build_filters()
+
+            candidates = None
+            for tag_type, values in (tags or {}).items():
+                matching = set()
+                for value in values:
+                    matching |= self._filters['tags'].get((tag_type, value), set())
+                candidates = matching if candidates is None else candidates & matching
+
+            if min_points is not None or max_points is not None:
+                points = self._filters['points']
+                lo = 0 if min_points is None else bisect.bisect_left(points, (min_points,))
+                hi = len(points) if max_points is None else bisect.bisect_right(points, (max_points, '\uffff'))
+                in_range = {question_id for _, question_id in points[lo:hi]}
+                candidates = in_range if candidates is None else candidates & in_range
+
+            if candidates is None:
+                candidates = self._entries.keys()
+            questions = [self._entries[question_id]['metadata'] for question_id in candidates
+                         if question_id in self._entries and self._entries[question_id]['metadata'] is not None]
+
+        sort_key = SORT_KEYS[sort]
+        keyed = sorted(((sort_key(m), m['id']), m) for m in questions)
+        if descending:
+            keyed.reverse()
+        total = len(keyed)
+
+        if after is not None:
+            after = tuple(after)
+            keyed = [item for item in keyed if (item[0] < after if descending else item[0] > after)]
+        if limit is not None and len(keyed) > limit:
+            return [m for _, m in keyed[:limit]], total, keyed[limit - 1][0]
+        return [m for _, m in keyed], total, None
+
+    def search(self, text, limit=20, offset=0):
+        """Full-text search over name, content and hints.
+
+        Returns ([(metadata, score)], total matches), best match first.
+        """
+        self.refresh()
+        with self._lock:
+            if self._search is None:
+                self._search = InvertedIndex()
+                for question_id, entry in self._entries.items():
+                    if entry['metadata'] is not None:
+                        self._search.add(question_id, question_fields(entry['metadata']))
+            ranked, total = self._search.search(text, limit, offset)
+            return [(self._entries[question_id]['metadata'], score) for question_id, score in ranked], total
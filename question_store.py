@@ -0,0 +1,381 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: start_server.py runs a single server process there
+    fcntl = None
+from question_index import QuestionIndex
+from search_index import FIELD_WEIGHTS, question_fields, tokenize
+
+# Both stores share the same interface:
+#   get(question_id) -> {'folder_path': ..., 'metadata': ...} or None
+#   all()            -> list of metadata dicts
+#   entries()        -> iterator of (folder_path, metadata), in no particular order
+#   query(...)       -> (metadata dicts, total, cursor key or None), see QuestionIndex.query
+#   search(text, limit, offset) -> ([(metadata, score)], total)
+#   save(folder_path, metadata, expected_version=None)
+#   save_many([(folder_path, metadata)])
+#   remove(question_id)
+# Compiled files (question.tex/.pdf) always live in the question's folder.
+
+class VersionConflict(Exception):
+    """The question was saved by someone else since the caller read it."""
+
+    def __init__(self, version):
+        super().__init__(f"Question is at version {version}")
+        self.version = version
+
+def stored_version(metadata):
+    """Version counter of a question's metadata; questions saved before it existed are at 1."""
+    return metadata.get('version', 1)
+
+class FolderQuestionStore(QuestionIndex):
+    """Metadata in <questions_dir>/<folder>/metadata.json, served from the index."""
+
+    def __init__(self, questions_dir, refresh_interval=2.0):
+        super().__init__(questions_dir, refresh_interval)
+        self._save_lock = threading.Lock()
+
+    def save(self, folder_path, metadata, expected_version=None):
+        """Write metadata.json in place of the old one.
+
+        With expected_version, raise VersionConflict unless the file on disk
+        is still at that version.
+        """
+        metadata_path = os.path.join(folder_path, 'metadata.json')
+        with self._locked(folder_path):
+            if expected_version is not None:
+                try:
+                    with open(metadata_path, 'r') as f:
+                        current = stored_version(json.load(f))
+                except (OSError, ValueError):
+                    current = None
+                if current != expected_version:
+                    raise VersionConflict(current)
+
+            # Write-then-rename so readers never see a half-written file
+            tmp_path = f"{metadata_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(metadata, f, indent=2)
+            os.replace(tmp_path, metadata_path)
+            self.put(folder_path, metadata)
+
+    @contextmanager
+    def _locked(self, folder_path):
+        """Hold off other threads and server processes saving the same question."""
+        with self._save_lock, open(os.path.join(folder_path, 'metadata.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def save_many(self, items):
+        """Save several questions; each still gets its own metadata.json."""
+        for folder_path, metadata in items:
+            self.save(folder_path, metadata)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    created_at TEXT,
+    updated_at TEXT,
+    points NUMERIC,
+    answer TEXT,
+    content TEXT,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_questions_points ON questions(points);
+CREATE INDEX IF NOT EXISTS idx_questions_created_at ON questions(created_at);
+CREATE INDEX IF NOT EXISTS idx_questions_name ON questions(lower(name));
+
+CREATE TABLE IF NOT EXISTS tags (
+    question_id TEXT NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    type TEXT,
+    value TEXT COLLATE NOCASE,
+    PRIMARY KEY (question_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_tags_type_value ON tags(type, value);
+
+CREATE TABLE IF NOT EXISTS hints (
+    question_id TEXT NOT NULL REFERENCES questions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT,
+    points_deduction NUMERIC,
+    PRIMARY KEY (question_id, position)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+    id UNINDEXED, name, content, hints, tokenize = 'unicode61'
+);
+"""
+
+# SQL expressions matching question_index.SORT_KEYS
+SORT_COLUMNS = {
+    'created_at': "coalesce(created_at, '')",
+    'name': "lower(name)",
+    'points': "coalesce(points, 0)",
+    'compile_time': "coalesce(json_extract(extra, '$.compile.wall_seconds'), 0)"
+}
+
+# Metadata keys with their own column; anything else goes to the extra JSON
+QUESTION_COLUMNS = ('id', 'name', 'created_at', 'updated_at', 'points', 'answer', 'content')
+
+class SqliteQuestionStore:
+    """Question metadata in indexed SQLite tables, PDFs stay on disk."""
+
+    def __init__(self, db_path, questions_dir):
+        self.db_path = db_path
+        self.questions_dir = questions_dir
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        self._backfill_search(conn)
+
+    def _conn(self):
+        """One connection per thread; sqlite3 connections can't be shared."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _search_rowid(question_id):
+        """Stable FTS rowid for a question, so its row can be replaced without a scan."""
+        return int(hashlib.sha1(question_id.encode('utf-8')).hexdigest()[:15], 16)
+
+    def _backfill_search(self, conn):
+        """Index questions stored before the full-text table existed."""
+        indexed = {row['id'] for row in conn.execute("SELECT id FROM questions_fts")}
+        for row in conn.execute("SELECT id FROM questions").fetchall():
+            if row['id'] not in indexed:
+                with conn:
+                    self._index_search(conn, self.get(row['id'])['metadata'])
+
+    def _index_search(self, conn, metadata):
+        fields = question_fields(metadata)
+        rowid = self._search_rowid(metadata['id'])
+        conn.execute("DELETE FROM questions_fts WHERE rowid = ?", (rowid,))
+        conn.execute(
+            "INSERT INTO questions_fts (rowid, id, name, content, hints) VALUES (?, ?, ?, ?, ?)",
+            (rowid, metadata['id'], fields['name'], fields['content'], fields['hints'])
+        )
+
+    def _metadata(self, row, tags, hints):
+        metadata = {
+            'id': row['id'],
+            'name': row['name'],
+            'created_at': row['created_at'],
+            'tags': tags,
+            'points': row['points'],
+            'hints': hints,
+            'answer': row['answer'],
+            'content': row['content']
+        }
+        metadata.update(json.loads(row['extra']))
+        if row['updated_at'] is not None:
+            metadata['updated_at'] = row['updated_at']
+        return metadata
+
+    def _children(self, conn, question_ids=None):
+        """Tags and hints grouped by question id, in their original order."""
+        where = ''
+        params = ()
+        if question_ids is not None:
+            where = f"WHERE question_id IN ({','.join('?' * len(question_ids))})"
+            params = tuple(question_ids)
+
+        tags, hints = {}, {}
+        for row in conn.execute(f"SELECT * FROM tags {where} ORDER BY question_id, position", params):
+            tags.setdefault(row['question_id'], []).append({'type': row['type'], 'value': row['value']})
+        for row in conn.execute(f"SELECT * FROM hints {where} ORDER BY question_id, position", params):
+            hints.setdefault(row['question_id'], []).append({
+                'text': row['text'],
+                'points_deduction': row['points_deduction']
+            })
+        return tags, hints
+
+    def get(self, question_id):
+        conn = self._conn()
+        row = conn.execute("SELECT * FROM questions WHERE id = ?", (question_id,)).fetchone()
+        if row is None:
+            return None
+        tags, hints = self._children(conn, [question_id])
+        return {
+            'folder_path': os.path.join(self.questions_dir, row['folder']),
+            'metadata': self._metadata(row, tags.get(question_id, []), hints.get(question_id, []))
+        }
+
+    def all(self):
+        conn = self._conn()
+        rows = conn.execute("SELECT * FROM questions ORDER BY created_at").fetchall()
+        tags, hints = self._children(conn)
+        return [self._metadata(row, tags.get(row['id'], []), hints.get(row['id'], [])) for row in rows]
+
+    def entries(self, page_size=500):
+        """(folder_path, metadata) of every question, read by id a page at a time."""
+        conn = self._conn()
+        after = ''
+        while True:
+            rows = conn.execute("SELECT * FROM questions WHERE id > ? ORDER BY id LIMIT ?",
+                                (after, page_size)).fetchall()
+            if not rows:
+                return
+            tags, hints = self._children(conn, [row['id'] for row in rows])
+            for row in rows:
+                yield (os.path.join(self.questions_dir, row['folder']),
+                       self._metadata(row, tags.get(row['id'], []), hints.get(row['id'], [])))
+            after = rows[-1]['id']
+
+    def query(self, tags=None, min_points=None, max_points=None,
+              sort='created_at', descending=False, after=None, limit=None):
+        """Same contract as QuestionIndex.query, answered from the indexes."""
+        where = []
+        params = []
+        for tag_type, values in (tags or {}).items():
+            where.append(f"id IN (SELECT question_id FROM tags WHERE type = ? AND value IN ({','.join('?' * len(values))}))")
+            params += [tag_type] + list(values)
+        if min_points is not None:
+            where.append("points >= ?")
+            params.append(min_points)
+        if max_points is not None:
+            where.append("points <= ?")
+            params.append(max_points)
+
+        conn = self._conn()
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+        total = conn.execute(f"SELECT COUNT(*) FROM questions {where_sql}", params).fetchone()[0]
+
+        sort_sql = SORT_COLUMNS[sort]
+        if after is not None:
+            where.append(f"({sort_sql}, id) {'<' if descending else '>'} (?, ?)")
+            params += list(after)
+            where_sql = f"WHERE {' AND '.join(where)}"
+        order = 'DESC' if descending else 'ASC'
+        limit_sql = ''
+        if limit is not None:
+            limit_sql = 'LIMIT ?'
+            params.append(limit + 1)
+
+        rows = conn.execute(
+            f"SELECT *, {sort_sql} AS sort_value FROM questions {where_sql} "
+            f"ORDER BY sort_value {order}, id {order} {limit_sql}",
+            params
+        ).fetchall()
+
+        next_after = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_after = (rows[-1]['sort_value'], rows[-1]['id'])
+
+        tags_by_id, hints_by_id = self._children(conn, [row['id'] for row in rows]) if rows else ({}, {})
+        questions = [self._metadata(row, tags_by_id.get(row['id'], []), hints_by_id.get(row['id'], []))
+                     for row in rows]
+        return questions, total, next_after
+
+    def search(self, text, limit=20, offset=0):
+        """Full-text search through the FTS5 table, ranked by bm25."""
+        terms = sorted(set(tokenize(text)))
+        if not terms:
+            return [], 0
+        # Quote every term so user input can't use FTS5 query syntax
+        match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+        conn = self._conn()
+        total = conn.execute(
+            "SELECT COUNT(*) FROM questions_fts WHERE questions_fts MATCH ?", (match,)
+        ).fetchone()[0]
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in ('name', 'content', 'hints'))
+        rows = conn.execute(
+            f"SELECT id, -bm25(questions_fts, 0, {weights}) AS score FROM questions_fts "
+            f"WHERE questions_fts MATCH ? ORDER BY score DESC, id LIMIT ? OFFSET ?",
+            (match, limit, offset)
+        ).fetchall()
+
+        results = []
+        for row in rows:
+            entry = self.get(row['id'])
+            if entry:
+                results.append((entry['metadata'], row['score']))
+        return results, total
+
+    def save(self, folder_path, metadata, expected_version=None):
+        """Insert or replace a question and its tags and hints in one transaction.
+
+        With expected_version, raise VersionConflict unless the stored
+        question is still at that version.
+        """
+        if expected_version is None:
+            self.save_many([(folder_path, metadata)])
+            return
+        conn = self._conn()
+        with conn:
+            # Take the write lock before reading, so nobody saves in between
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute("SELECT json_extract(extra, '$.version') AS version FROM questions WHERE id = ?",
+                               (metadata['id'],)).fetchone()
+            current = None if row is None else (row['version'] or 1)
+            if current != expected_version:
+                raise VersionConflict(current)
+            self._save(conn, folder_path, metadata)
+
+    def save_many(self, items):
+        """Insert or replace several questions in a single transaction."""
+        conn = self._conn()
+        with conn:
+            for folder_path, metadata in items:
+                self._save(conn, folder_path, metadata)
+
+    def _save(self, conn, folder_path, metadata):
+        extra = {k: v for k, v in metadata.items() if k not in QUESTION_COLUMNS and k not in ('tags', 'hints')}
+        values = [metadata.get(column) for column in QUESTION_COLUMNS]
+        question_id = metadata['id']
+
+        conn.execute(
+            f"""INSERT INTO questions (folder, extra, {', '.join(QUESTION_COLUMNS)})
+                VALUES (?, ?, {', '.join('?' * len(QUESTION_COLUMNS))})
+                ON CONFLICT(id) DO UPDATE SET
+                folder = excluded.folder, extra = excluded.extra,
+                {', '.join(f'{c} = excluded.{c}' for c in QUESTION_COLUMNS if c != 'id')}""",
+            [os.path.basename(folder_path), json.dumps(extra)] + values
+        )
+        conn.execute("DELETE FROM tags WHERE question_id = ?", (question_id,))
+        conn.execute("DELETE FROM hints WHERE question_id = ?", (question_id,))
+        conn.executemany(
+            "INSERT INTO tags (question_id, position, type, value) VALUES (?, ?, ?, ?)",
+            [(question_id, i, tag.get('type'), tag.get('value'))
+             for i, tag in enumerate(metadata.get('tags', []))]
+        )
+        conn.executemany(
+            "INSERT INTO hints (question_id, position, text, points_deduction) VALUES (?, ?, ?, ?)",
+            [(question_id, i, hint.get('text', ''), hint.get('points_deduction', 0))
+             for i, hint in enumerate(metadata.get('hints', []))]
+        )
+        self._index_search(conn, metadata)
+
+    def remove(self, question_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM questions WHERE id = ?", (question_id,))
+            conn.execute("DELETE FROM questions_fts WHERE rowid = ?", (self._search_rowid(question_id),))
+
+def open_question_store(backend, questions_dir, sqlite_path):
+    """Create the store selected by HEXAGYM_STORAGE ('folder' or 'sqlite')."""
+    if backend == 'folder':
+        return FolderQuestionStore(questions_dir)
+    if backend == 'sqlite':
+        return SqliteQuestionStore(sqlite_path, questions_dir)
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,107 @@
+import re
+import math
+import threading
+
+# Figure environments are drawing code; their coordinates and styles are noise
+FIGURE_ENV_PATTERN = re.compile(
+    r'\\begin\{(tikzpicture|circuitikz|axis)\}.*?\\end\{\1\}', re.DOTALL
+)
+COMMENT_PATTERN = re.compile(r'(?<!\\)%.*')
+COMMAND_PATTERN = re.compile(r'\\[a-zA-Z@]+\*?')
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Relative weight of a term occurrence in each field
+FIELD_WEIGHTS = {'name': 3.0, 'content': 1.0, 'hints': 0.5}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+def latex_to_text(latex):
+    """Rough plain text of a LaTeX body: no comments, commands or figure code."""
+    text = COMMENT_PATTERN.sub(' ', latex or '')
+    text = FIGURE_ENV_PATTERN.sub(' ', text)
+    text = COMMAND_PATTERN.sub(' ', text)
+    return re.sub(r'[{}\[\]$^_&~\\]', ' ', text)
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall((text or '').lower()) if len(token) > 1]
+
+def question_fields(metadata):
+    """The searchable text of a question, per field."""
+    return {
+        'name': metadata.get('name', ''),
+        'content': latex_to_text(metadata.get('content', '')),
+        'hints': ' '.join(hint.get('text', '') for hint in metadata.get('hints', []))
+    }
+
+class InvertedIndex:
+    """In-memory term -> postings index with BM25 ranking.
+
+    Each document's term frequency is the field-weighted sum of its
+    occurrences (see FIELD_WEIGHTS); a query matches documents containing
+    every query term.
+    """
+
+    def __init__(self):
+        self._postings = {}  # term -> {doc_id: weighted tf}
+        self._doc_terms = {}  # doc_id -> set of terms, for removal
+        self._doc_lengths = {}
+        self._total_length = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, doc_id, fields):
+        """Index (or reindex) a document given as {field name: text}."""
+        frequencies = {}
+        length = 0.0
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for token in tokenize(text):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+                length += weight
+
+        with self._lock:
+            self._remove(doc_id)
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[doc_id] = frequency
+            self._doc_terms[doc_id] = set(frequencies)
+            self._doc_lengths[doc_id] = length
+            self._total_length += length
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id, 0.0)
+
+    def search(self, query, limit=20, offset=0):
+        """Return ([(doc_id, score)], total matches), best first."""
+        terms = set(tokenize(query))
+        if not terms:
+            return [], 0
+
+        with self._lock:
+            postings = [self._postings.get(term, {}) for term in terms]
+            if not all(postings):
+                return [], 0
+            postings.sort(key=len)
+            matches = set(postings[0]).intersection(*postings[1:])
+
+            doc_count = len(self._doc_lengths)
+            avg_length = self._total_length / doc_count if doc_count else 0.0
+            scores = {}
+            for term_postings in postings:
+                idf = math.log(1 + (doc_count - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+                for doc_id in matches:
+                    tf = term_postings[doc_id]
+                    norm = K1 * (1 - B + B * self._doc_lengths[doc_id] / (avg_length or 1.0))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[offset:offset + limit], len(ranked)
@@ -1,5 +1,6 @@
 import socket
 import subprocess
+import argparse
 import sys
 import os
 
@@ -16,23 +17,115 @@ def get_ip():
         s.close()
     return IP
 
+def parse_args():
+    cpus = os.cpu_count() or 2
+    parser = argparse.ArgumentParser(description="Start the HexaGym server.")
+    parser.add_argument('--production', action='store_true',
+                        help="serve with a multi-process, multi-threaded WSGI server "
+                             "instead of Flask's development server")
+    parser.add_argument('--port', type=int, default=int(os.environ.get('HEXAGYM_PORT', '5000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('HEXAGYM_WORKERS', str(cpus))),
+                        help="server processes (production mode)")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('HEXAGYM_THREADS', '8')),
+                        help="request threads per process (production mode)")
+    parser.add_argument('--keepalive', type=int, default=int(os.environ.get('HEXAGYM_KEEPALIVE', '5')),
+                        help="seconds an idle keep-alive connection stays open (production mode)")
+    parser.add_argument('--graceful-timeout', type=int,
+                        default=int(os.environ.get('HEXAGYM_GRACEFUL_TIMEOUT', '30')),
+                        help="seconds in-flight requests get to finish on shutdown (production mode)")
+    return parser.parse_args()
+
+def run_gunicorn(args):
+    """Serve app:app with gunicorn's threaded workers."""
+    from gunicorn.app.base import BaseApplication
+
+    def post_worker_init(worker):
+        # Build (or load) the preamble format before the first compile needs it
+        import app
+        fmt_path = app.ensure_preamble_format()
+        if app.warm_pool is not None:
+            app.warm_pool.prime(fmt_path)
+
+    def worker_exit(server, worker):
+        # Flush buffered attempts and stop parked TeX workers before the process goes away
+        import app
+        if app._attempt_journal is not None:
+            app._attempt_journal.close()
+        if app.warm_pool is not None:
+            app.warm_pool.close()
+
+    class HexaGymServer(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f'0.0.0.0:{args.port}',
+                'workers': args.workers,
+                'threads': args.threads,
+                'worker_class': 'gthread',
+                'keepalive': args.keepalive,
+                'graceful_timeout': args.graceful_timeout,
+                # Compiles and bulk imports can run long; the request keeps its thread meanwhile
+                'timeout': 120,
+                # PDFs and static files go out with sendfile() instead of through Python
+                'sendfile': True,
+                'accesslog': '-',
+                'post_worker_init': post_worker_init,
+                'worker_exit': worker_exit
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            return app
+
+    HexaGymServer().run()
+
+def run_waitress(args):
+    """Windows has no fork(): serve with waitress in a single multi-threaded process."""
+    from waitress import serve
+    import app
+    app.ensure_preamble_format()
+    try:
+        serve(app.app, host='0.0.0.0', port=args.port, threads=args.workers * args.threads,
+              channel_timeout=max(args.keepalive, 30))
+    finally:
+        if app._attempt_journal is not None:
+            app._attempt_journal.close()
+
 def main():
+    args = parse_args()
     ip = get_ip()
-    
+
     print("\n===== HexaGym Server =====")
     print("\nNetwork Information:")
     print(f"Local IP: {ip}")
-    print(f"Access URL: http://{ip}:5000")
+    print(f"Access URL: http://{ip}:{args.port}")
     print("\nShare the above URL with others on the same network to access HexaGym")
     print("\nStarting server...")
     print("(Press CTRL+C to stop the server)")
     print("\n===========================\n")
-    
-    # Start the Flask application
-    if sys.platform.startswith('win'):
-        os.system("python app.py")
-    else:
-        os.system("python3 app.py")
+
+    if not args.production:
+        # Start the Flask application
+        os.environ['HEXAGYM_PORT'] = str(args.port)
+        if sys.platform.startswith('win'):
+            os.system("python app.py")
+        else:
+            os.system("python3 app.py")
+        return
+
+    # Every server process has its own compile pool; share the CPUs between them
+    if 'HEXAGYM_COMPILE_WORKERS' not in os.environ:
+        os.environ['HEXAGYM_COMPILE_WORKERS'] = str(max(1, (os.cpu_count() or 2) // args.workers))
+
+    try:
+        if sys.platform.startswith('win'):
+            run_waitress(args)
+        else:
+            run_gunicorn(args)
+    except ImportError as e:
+        print(f"Production mode needs the packages in requirements.txt ({e}).")
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
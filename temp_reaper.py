@@ -0,0 +1,118 @@
+import os
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+
+class TempReaper:
+    """Background cleanup of per-compile folders under temp_dir.
+
+    Every interval seconds, folders older than max_age are deleted, then
+    the oldest remaining ones until the total is within max_bytes. Folders
+    claimed by a compile in this process are never touched, and neither is
+    anything modified in the last grace seconds, which covers compiles
+    running in other server processes.
+    """
+
+    def __init__(self, temp_dir, max_age, max_bytes, interval=60, grace=300):
+        self.temp_dir = temp_dir
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.grace = grace
+        self.runs = 0
+        self.removed = 0
+        self.bytes_reclaimed = 0
+        self.last_bytes = 0
+        self.last_folders = 0
+        self._claimed = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='temp-reaper', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.reap()
+            except Exception as e:
+                print(f"Error cleaning {self.temp_dir}: {e}")
+            time.sleep(self.interval)
+
+    @contextmanager
+    def claim(self, folder):
+        """Keep folder alive while a compile is using it."""
+        folder = os.path.abspath(folder)
+        with self._lock:
+            self._claimed.add(folder)
+        try:
+            yield folder
+        finally:
+            with self._lock:
+                self._claimed.discard(folder)
+
+    @staticmethod
+    def _scan(folder):
+        """(total bytes, newest mtime) of the files in a folder."""
+        size = 0
+        newest = os.path.getmtime(folder)
+        for entry in os.scandir(folder):
+            stat = entry.stat(follow_symlinks=False)
+            size += stat.st_size
+            newest = max(newest, stat.st_mtime)
+        return size, newest
+
+    def reap(self):
+        """Run one cleanup pass; returns the bytes it freed."""
+        folders = []
+        for entry in os.scandir(self.temp_dir):
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                size, newest = self._scan(entry.path)
+            except OSError:
+                continue
+            folders.append((newest, entry.path, size))
+        folders.sort()
+
+        now = time.time()
+        total = sum(size for _, _, size in folders)
+        reclaimed = removed = 0
+        for newest, path, size in folders:
+            expired = now - newest > self.max_age
+            if not expired and total <= self.max_bytes:
+                # Oldest first, so nothing after this one is due either
+                break
+            if now - newest < self.grace:
+                break
+            with self._lock:
+                if os.path.abspath(path) in self._claimed:
+                    continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            reclaimed += size
+            removed += 1
+
+        with self._lock:
+            self.runs += 1
+            self.removed += removed
+            self.bytes_reclaimed += reclaimed
+            self.last_bytes = total
+            self.last_folders = len(folders) - removed
+        return reclaimed
+
+    def stats(self):
+        with self._lock:
+            return {
+                'runs': self.runs,
+                'folders': self.last_folders,
+                'bytes': self.last_bytes,
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+                'removed': self.removed,
+                'bytes_reclaimed': self.bytes_reclaimed
+            }
@@ -0,0 +1,219 @@
+import os
+import time
+import errno
+import shutil
+import itertools
+import threading
+from collections import deque
+from compile_sandbox import SandboxedProcess
+
+# Inside each worker's folder: the document pdflatex is started on, and the
+# named pipe it reads the question body from
+DRIVER_FILE = 'driver.tex'
+BODY_PIPE = 'body.tex'
+JOB_NAME = 'question'
+
+# How long run() waits for a worker that is still loading the preamble
+PARK_WAIT_SECONDS = 5
+
+class WarmTexPool:
+    """pdflatex processes kept waiting right after \\begin{document}.
+
+    Each worker runs on a driver document of preamble + \\input{body.tex} +
+    ending, where body.tex is a named pipe: TeX loads the preamble (or the
+    precompiled format), then blocks opening the pipe. run() writes a
+    question body into the pipe, lets the worker finish the document and
+    copies the output next to the question's .tex; a fresh worker is started
+    in its place in the background. When no worker is parked, run() returns
+    None and the caller compiles the usual way.
+    """
+
+    def __init__(self, size, work_dir, preamble, ending, limits):
+        self.size = size
+        self.work_dir = work_dir
+        self.preamble = preamble
+        self.ending = ending
+        self.limits = limits
+        self.hits = 0
+        self.misses = 0
+        self.spawned = 0
+        self._fmt_path = None
+        self._idle = deque()
+        self._spawning = 0
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        os.makedirs(work_dir, exist_ok=True)
+        self._remove_orphans()
+
+    def _remove_orphans(self):
+        """Delete worker folders left behind by server processes that are gone."""
+        for name in os.listdir(self.work_dir):
+            try:
+                pid = int(name.split('-', 1)[0])
+                os.kill(pid, 0)
+                continue
+            except ValueError:
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+            shutil.rmtree(os.path.join(self.work_dir, name), ignore_errors=True)
+
+    def prime(self, fmt_path):
+        """Start workers for fmt_path ahead of the first compile."""
+        with self._lock:
+            self._fmt_path = fmt_path
+        self._refill()
+
+    def run(self, body, fmt_path, tex_path, on_line=None):
+        """Compile body on a parked worker, writing <tex_path minus .tex>.pdf/.log/.aux.
+
+        Returns the finished process as compile_sandbox.run_sandboxed does,
+        or None if no worker could take the job.
+        """
+        worker = self._take(fmt_path)
+        if worker is None:
+            return None
+
+        process = worker['process']
+        try:
+            process.on_line = on_line
+            pipe = self._open_pipe(worker)
+            with self._lock:
+                if pipe is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            if pipe is None:
+                process.kill()
+                process.wait()
+                return None
+
+            process.start_clock()
+            try:
+                with os.fdopen(pipe, 'w', encoding='utf-8') as f:
+                    f.write(body)
+                    if not body.endswith('\n'):
+                        f.write('\n')
+            except BrokenPipeError:
+                # TeX gave up reading (fatal error, limit); its exit status says why
+                pass
+            result = process.wait()
+
+            output_dir, name = os.path.split(os.path.splitext(tex_path)[0])
+            for ext in ('pdf', 'log', 'aux'):
+                built = os.path.join(worker['folder'], f"{JOB_NAME}.{ext}")
+                target = os.path.join(output_dir, f"{name}.{ext}")
+                if os.path.exists(built):
+                    shutil.copyfile(built, target)
+                elif ext == 'pdf' and os.path.exists(target):
+                    # Don't leave an older PDF looking like this run's output
+                    os.unlink(target)
+            return result
+        finally:
+            shutil.rmtree(worker['folder'], ignore_errors=True)
+
+    def _take(self, fmt_path):
+        stale = []
+        worker = None
+        with self._lock:
+            self._fmt_path = fmt_path
+            while self._idle:
+                candidate = self._idle.popleft()
+                if candidate['fmt_path'] == fmt_path and candidate['process'].alive():
+                    worker = candidate
+                    break
+                stale.append(candidate)
+            if worker is None:
+                self.misses += 1
+        for candidate in stale:
+            self._discard(candidate)
+        self._refill()
+        return worker
+
+    def _open_pipe(self, worker):
+        """Open the worker's body pipe for writing once TeX has it open for reading."""
+        path = os.path.join(worker['folder'], BODY_PIPE)
+        deadline = time.monotonic() + PARK_WAIT_SECONDS
+        while True:
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+                os.set_blocking(fd, True)
+                return fd
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+            # ENXIO: nobody reading yet, TeX is still loading the preamble
+            if time.monotonic() > deadline or not worker['process'].alive():
+                return None
+            time.sleep(0.005)
+
+    def _refill(self):
+        with self._lock:
+            if self._closed:
+                return
+            missing = self.size - len(self._idle) - self._spawning
+            if missing <= 0:
+                return
+            self._spawning += missing
+        for _ in range(missing):
+            threading.Thread(target=self._spawn_one, name='tex-pool-spawn', daemon=True).start()
+
+    def _spawn_one(self):
+        worker = None
+        try:
+            worker = self._spawn(self._fmt_path)
+        except OSError as e:
+            print(f"Starting a warm TeX worker failed: {e}")
+        with self._lock:
+            self._spawning -= 1
+            if worker is not None and not self._closed:
+                self._idle.append(worker)
+                self.spawned += 1
+                worker = None
+        if worker is not None:
+            self._discard(worker)
+
+    def _spawn(self, fmt_path):
+        folder = os.path.join(self.work_dir, f"{os.getpid()}-{next(self._ids)}")
+        os.makedirs(folder)
+        try:
+            os.mkfifo(os.path.join(folder, BODY_PIPE))
+            with open(os.path.join(folder, DRIVER_FILE), 'w', encoding='utf-8') as f:
+                f.write(self.preamble + '\\input{' + BODY_PIPE + '}\n' + self.ending)
+
+            command = ['pdflatex', '-interaction=nonstopmode', f'-jobname={JOB_NAME}', DRIVER_FILE]
+            if fmt_path:
+                command.insert(1, f'-fmt={fmt_path}')
+            process = SandboxedProcess(command, self.limits, cwd=folder)
+        except OSError:
+            shutil.rmtree(folder, ignore_errors=True)
+            raise
+        return {'folder': folder, 'process': process, 'fmt_path': fmt_path}
+
+    def _discard(self, worker):
+        worker['process'].kill()
+        worker['process'].wait()
+        shutil.rmtree(worker['folder'], ignore_errors=True)
+
+    def close(self):
+        """Stop the parked workers."""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for worker in idle:
+            self._discard(worker)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'idle': len(self._idle),
+                'starting': self._spawning,
+                'hits': self.hits,
+                'misses': self.misses,
+                'spawned': self.spawned
+            }
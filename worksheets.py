@@ -0,0 +1,47 @@
+import os
+import json
+import hashlib
+
+# The worksheet document places each question's compiled PDF as is, pages
+# and all, with pdfpages; nothing of the questions is compiled again
+WORKSHEET_HEADER = r"""\documentclass[12pt,a4paper]{article}
+\usepackage{pdfpages}
+\begin{document}
+"""
+WORKSHEET_ENDING = r"""\end{document}
+"""
+
+# Labels go in the top margin of a question's first page, in bp from its
+# lower left corner (A4 is 595 x 842bp, questions have 1in = 72bp margins)
+TITLE_POSITION = (297, 815)
+LABEL_POSITION = (72, 785)
+
+LATEX_SPECIALS = {
+    '\\': r'\textbackslash{}', '{': r'\{', '}': r'\}', '$': r'\$', '&': r'\&', '#': r'\#',
+    '^': r'\^{}', '_': r'\_', '%': r'\%', '~': r'\~{}'
+}
+
+def latex_escape(text):
+    """text as LaTeX that typesets it literally."""
+    return ''.join(LATEX_SPECIALS.get(char, char) for char in text)
+
+def worksheet_key(questions, title):
+    """Cache key of a worksheet: its title and, in order, each question's id,
+    version and compiled PDF."""
+    parts = [[q['id'], q.get('version', 1), (q.get('files') or {}).get('pdf_hash')] for q in questions]
+    payload = json.dumps({'title': title, 'questions': parts, 'document': WORKSHEET_HEADER + WORKSHEET_ENDING})
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def worksheet_document(pdf_paths, title=None):
+    """LaTeX for a worksheet of the given question PDFs, numbered in order."""
+    lines = [WORKSHEET_HEADER]
+    for number, pdf_path in enumerate(pdf_paths, 1):
+        labels = [r'\put(%d,%d){\large\bfseries Question %d}' % (LABEL_POSITION + (number,))]
+        if title and number == 1:
+            labels.append(r'\put(%d,%d){\makebox(0,0){\Large\bfseries %s}}' % (TITLE_POSITION + (latex_escape(title),)))
+        # picturecommand* draws on the first page of this PDF only
+        lines.append(r'\includepdf[pages=-,picturecommand*={%s}]{%s}' % (
+            ''.join(labels), os.path.abspath(pdf_path).replace(os.sep, '/')))
+        lines.append('\n')
+    lines.append(WORKSHEET_ENDING)
+    return ''.join(lines)